@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Рубрикатор: точность и скорость на размеченном корпусе заголовков.
+
+    python bench/bench_category.py            # замер: старый guess_category против categories
+    python bench/bench_category.py --build    # пополнить корпус: data/history.json, data/events.jsonl,
+                                              # записанные ленты bench/fixtures (bench_offline.py --record)
+
+Корпус — bench/category_corpus.jsonl: {"title", "link", "label", "by", "split"}.
+split="tune" — заголовки, по которым подбирались ключи data/categories.json:
+точность на них завышена и для сравнения не годится. Всё, что добавляет
+--build, и заголовки, размеченные руками до замера (link=null), — split="held"
+(отложенная выборка); ключи по ней не правят, а записи, на которых правили,
+переводят в "tune".
+Метка при пополнении — рубрика записи в ленте (<category>, by="feed") или
+рубрика в URL (/economics/, /politika/ …, by="url"); остальные записи
+добавляются с label=null и подсказкой "guess" — их размечают руками
+(by="manual"), в замер идут только записи с меткой.
+"""
+
+import json
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+import categories  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "bench", "category_corpus.jsonl")
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+# длины текста статьи в замере: legacy читает текст целиком, categories — body_chars
+BODY_LENS = (2000, 6000)
+
+# рубрики в адресах наших источников
+URL_SECTIONS = {
+    "economics": "Экономика", "ekonomika": "Экономика", "economy": "Экономика", "business": "Экономика",
+    "finances": "Экономика", "finance": "Экономика", "auto": "Экономика", "realty": "Экономика",
+    "politics": "Политика", "politika": "Политика", "world": "Политика", "mezhdunarodnaya-panorama": "Политика",
+    "incidents": "Происшествия", "proisshestviya": "Происшествия", "crime": "Происшествия",
+    "technology": "Технологии", "tech": "Технологии", "science": "Технологии", "nauka": "Технологии",
+    "society": "Общество", "obschestvo": "Общество",
+    "culture": "Культура", "kultura": "Культура",
+    "sport": "Спорт",
+}
+
+
+def legacy_guess(title: str, body: str) -> str:
+    # копия guess_category до categories (ветка без метатега)
+    low = (title + " " + body).lower()
+    if any(w in low for w in ["акция", "рынок", "инфляц", "бюджет", "эконом"]):
+        return "Экономика"
+    if any(w in low for w in ["технолог", "стартап", "it", "программист", "искусств", "нейросет"]):
+        return "Технологии"
+    if any(w in low for w in ["суд", "следователь", "силов", "мвд", "мчс", "происшеств"]):
+        return "Происшествия"
+    if any(w in low for w in ["полит", "парламент", "правительств", "санкц"]):
+        return "Политика"
+    return "Общество"
+
+
+def load_corpus() -> list:
+    if not os.path.exists(CORPUS):
+        return []
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def url_label(link: str):
+    for part in urlparse(link).path.lower().split("/"):
+        if part in URL_SECTIONS:
+            return URL_SECTIONS[part]
+    return None
+
+
+def feed_entries(fixtures: str) -> list:
+    """(title, link, рубрики из ленты) из записанных bench_offline.py --record лент."""
+    manifest = os.path.join(fixtures, "manifest.json")
+    if not os.path.exists(manifest):
+        return []
+    import feedparser
+    with open(manifest, encoding="utf-8") as f:
+        files = json.load(f)
+    out = []
+    for url, rec in files.items():
+        if not rec["file"].endswith(".xml"):
+            continue
+        with open(os.path.join(fixtures, rec["file"]), "rb") as f:
+            for e in feedparser.parse(f.read()).entries:
+                out.append((e.get("title"), e.get("link"), [t.get("term") or "" for t in e.get("tags", [])]))
+    return out
+
+
+def build():
+    corpus = load_corpus()
+    known = {r["link"] for r in corpus}
+    found = []
+    hist = os.path.join(ROOT, "data", "history.json")
+    if os.path.exists(hist):
+        with open(hist, encoding="utf-8") as f:
+            found += [(r.get("title"), r.get("link")) for r in json.load(f)]
+    events = os.path.join(ROOT, "data", "events.jsonl")
+    if os.path.exists(events):
+        with open(events, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                if r.get("kind") == "posted":
+                    found.append((r.get("title"), r.get("link")))
+    found = [(t, l, []) for t, l in found] + feed_entries(FIXTURES)
+
+    clf = categories.classifier()
+    added = 0
+    for title, link, tags in found:
+        if not title or not link or link in known:
+            continue
+        known.add(link)
+        # рубрика ленты — через aliases (названия рубрик сайтов), не через ключи по словам
+        label = next(filter(None, (clf.simplify(t, default="") for t in tags)), None)
+        by = "feed" if label else None
+        if not label:
+            label = url_label(link)
+            by = "url" if label else None
+        rec = {"title": title, "link": link, "label": label, "by": by, "split": "held"}
+        if not label:
+            rec["guess"] = clf.guess(title)
+        corpus.append(rec)
+        added += 1
+    with open(CORPUS, "w", encoding="utf-8") as f:
+        for r in corpus:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    todo = sum(1 for r in corpus if not r.get("label"))
+    held = sum(1 for r in corpus if r.get("label") and r.get("split") != "tune")
+    print(f"added {added}, total {len(corpus)}, held-out labeled {held}, unlabeled {todo} -> {CORPUS}")
+
+
+def measure(rounds: int = 200):
+    corpus = [r for r in load_corpus() if r.get("label")]
+    if not corpus:
+        print("corpus is empty: run with --build and label the records")
+        return
+    clf = categories.classifier()
+    engines = (("legacy", lambda t: legacy_guess(t, "")), ("categories", clf.guess))
+    # записи без split — добавлены до разделения, считаем отложенными
+    splits = {"held": [r for r in corpus if r.get("split") != "tune"],
+              "tune": [r for r in corpus if r.get("split") == "tune"]}
+    print(f"{len(corpus)} labeled titles: held-out {len(splits['held'])}, tuning {len(splits['tune'])}")
+    if not splits["held"]:
+        print("no held-out titles: accuracy below is on the tuning set and says nothing about new news;"
+              " run --build (recorded feeds, URL-labelled links) first")
+    for name, fn in engines:
+        acc = ", ".join(f"{sp} {sum(fn(r['title']) == r['label'] for r in rs)}/{len(rs)}"
+                        for sp, rs in splits.items() if rs)
+        t = time.perf_counter()
+        for _ in range(rounds):
+            for r in corpus:
+                fn(r["title"])
+        dt = (time.perf_counter() - t) / (rounds * len(corpus))
+        print(f"{name:<11}: accuracy {acc}; {dt * 1e6:6.2f} us/title")
+    # с текстом: заголовки корпуса подряд вместо тела статьи
+    for n in BODY_LENS:
+        body = " ".join(r["title"] for r in corpus * (n // 500 + 1))[:n]
+        for name, fn in (("legacy", legacy_guess), ("categories", clf.guess)):
+            t = time.perf_counter()
+            for _ in range(rounds // 10):
+                for r in corpus:
+                    fn(r["title"], body)
+            dt = (time.perf_counter() - t) / (rounds // 10 * len(corpus))
+            print(f"{name:<11}: title + {n}-char body {dt * 1e6:7.2f} us")
+    misses = [r for r in corpus if clf.guess(r["title"]) != r["label"]]
+    for r in misses:
+        print(f"  miss ({r.get('split') or 'held'}): {clf.guess(r['title'])} != {r['label']}: {r['title'][:70]}")
+
+
+if __name__ == "__main__":
+    if "--build" in sys.argv:
+        build()
+    else:
+        measure()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк вёрстки заголовка обложки на реальных заголовках
+из data/history.json (и data/events.jsonl, если он есть).
+
+    python bench/bench_cover_text.py [rounds]
+
+Сравнивает старый draw_multiline_fit (шрифт с диска на каждой итерации,
+линейный перебор кеглей, перемер каждой растущей строки) с новым.
+"""
+
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+import cover  # noqa: E402
+
+BOX = (52, 176, 1176, 292)  # как в draw_header_image: x, y, w, h
+
+
+def load_titles():
+    titles = []
+    try:
+        with open(os.path.join(ROOT, "data", "history.json"), encoding="utf-8") as f:
+            titles += [it["title"] for it in json.load(f) if it.get("title")]
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(ROOT, "data", "events.jsonl"), encoding="utf-8") as f:
+            for ln in f:
+                rec = json.loads(ln)
+                if rec.get("kind") == "posted" and rec.get("title"):
+                    titles.append(rec["title"])
+    except (OSError, ValueError):
+        pass
+    return list(dict.fromkeys(titles))
+
+
+def legacy_fit(draw, text, box, line_spacing=6, max_lines=4):
+    # копия прежней реализации (без отрисовки)
+    x, y, w, h = box
+    size = 64
+    while size >= 20:
+        f = ImageFont.truetype(cover.font_path(True), size=size)
+        lines, line = [], []
+        for word in text.split():
+            test = " ".join(line + [word])
+            if cover.text_size(draw, test, f)[0] <= w:
+                line.append(word)
+            else:
+                if not line:
+                    line = [word]
+                lines.append(" ".join(line))
+                line = [word]
+        if line:
+            lines.append(" ".join(line))
+        if len(lines) > max_lines:
+            lines = lines[:max_lines]
+        total = sum(cover.text_size(draw, ln, f)[1] + line_spacing for ln in lines) - line_spacing
+        if total <= h:
+            return size
+        size -= 2
+    return 20
+
+
+def new_fit(draw, text, box, line_spacing=6, max_lines=4):
+    x, y, w, h = box
+    res = cover.fit_title(text, 64, w, h, line_spacing, max_lines)
+    return res[0].size if res else cover.TITLE_MIN_SIZE
+
+
+def run(fn, draw, titles, rounds):
+    t = time.perf_counter()
+    for _ in range(rounds):
+        for title in titles:
+            fn(draw, title, BOX)
+    return (time.perf_counter() - t) / (rounds * len(titles))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    titles = load_titles()
+    if not titles:
+        print("no titles found")
+        return
+    draw = ImageDraw.Draw(Image.new("RGB", (1280, 640)))
+
+    old = run(legacy_fit, draw, titles, max(1, rounds // 4))
+    for cached in (cover._load_font, cover.text_width, cover.text_height):
+        cached.cache_clear()
+    cold = run(new_fit, draw, titles, 1)
+    new = run(new_fit, draw, titles, rounds)
+    same = sum(new_fit(draw, t, BOX) == legacy_fit(draw, t, BOX) for t in titles)
+
+    print(f"titles: {len(titles)}")
+    print(f"legacy        : {old * 1000:8.3f} ms/title")
+    print(f"new (cold)    : {cold * 1000:8.3f} ms/title")
+    print(f"new (warm)    : {new * 1000:8.3f} ms/title")
+    print(f"speedup x{old / new:.1f} warm, x{old / cold:.1f} cold; same size chosen: {same}/{len(titles)}")
+
+
+if __name__ == "__main__":
+    main()
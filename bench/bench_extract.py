@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк извлечения статьи: старый путь (readability на строке + BeautifulSoup
+для summary и метатегов) против одного разбора lxml в extract_page().
+
+    python bench/bench_extract.py [page.html ...]
+
+Без аргументов используется синтетическая страница. Для старого пути нужен
+beautifulsoup4 (в зависимостях бота его больше нет).
+Память — пик RSS (ru_maxrss) в отдельном процессе на каждый путь: деревья
+lxml живут в libxml2, tracemalloc их не видит. Печатается пик процесса и его
+прирост над состоянием после импортов и чтения страниц (у маленькой страницы
+прирост бывает нулевым — разбор укладывается в память, освобождённую импортами).
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+
+import poster  # noqa: E402
+from readability import Document  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+def synthetic_page(paragraphs=40) -> str:
+    nav = "".join(f"<li><a href='/r{i}'>Рубрика {i}</a></li>" for i in range(60))
+    body = "".join(
+        f"<p>Абзац {i}: правительство обсудило бюджет, рынок отреагировал ростом, "
+        f"аналитики ждут снижения инфляции к концу года.</p>"
+        for i in range(paragraphs)
+    )
+    scripts = "<script>var x = 1;</script>" * 30
+    return (
+        "<html><head><title>Новость дня — РБК</title>"
+        "<meta property='article:section' content='Экономика'>"
+        "<meta property='og:image' content='https://example.org/a.jpg'>"
+        f"{scripts}</head><body><nav><ul>{nav}</ul></nav>"
+        f"<div class='article'><h1>Новость дня</h1>{body}</div>"
+        f"<footer><ul>{nav}</ul></footer></body></html>"
+    )
+
+
+def legacy_extract(html: str):
+    # копия extract_article до перехода на один разбор
+    doc = Document(html)
+    title = doc.short_title() or ""
+    soup = BeautifulSoup(doc.summary(html_partial=True), "lxml")
+    for bad in soup(["script", "style", "header", "footer", "nav", "form", "aside", "noscript"]):
+        bad.decompose()
+    paragraphs = [" ".join(p.get_text(separator=" ", strip=True).split()) for p in soup.find_all(["p", "li"])]
+    meta = BeautifulSoup(html, "lxml")
+    for tag in meta.find_all("meta"):
+        n = (tag.get("name") or tag.get("property") or "").lower()
+        if "section" in n or "category" in n:
+            break
+    return title, "\n\n".join(p for p in paragraphs if p)
+
+
+def new_extract(html: str):
+    return poster.extract_page("bench", html)
+
+
+PATHS = {"new": new_extract, "legacy": legacy_extract}
+
+
+def load_pages(files) -> list:
+    if files:
+        return [open(p, "rb").read().decode("utf-8", "replace") for p in files]
+    return [synthetic_page()]
+
+
+def measure(fn, pages, rounds):
+    fn(pages[0])  # прогрев
+    t = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            fn(html)
+    return (time.perf_counter() - t) / (rounds * len(pages))
+
+
+def max_rss() -> int:
+    """Пик RSS процесса, байты (Linux отдаёт KiB, macOS — байты)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def child_rss(path: str, files) -> dict:
+    """--rss в дочернем процессе: пик RSS и его прирост на одном проходе по страницам."""
+    pages = load_pages(files)
+    base = max_rss()
+    for html in pages:
+        PATHS[path](html)
+    top = max_rss()
+    return {"peak": top, "delta": top - base}
+
+
+# ru_maxrss дочернего процесса при exec() наследует пик того, кто его запустил
+# (Linux), а этот процесс уже разбирал страницы — запускаем через пустой python
+_LAUNCH = "import subprocess, sys; sys.exit(subprocess.call(sys.argv[1:]))"
+
+
+def peak(path: str, files) -> dict:
+    out = subprocess.run([sys.executable, "-c", _LAUNCH, sys.executable, __file__, "--rss", path, *files],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def show(name: str, per: float, mem: dict):
+    print(f"{name:<13}: {per * 1000:8.2f} ms/article, peak RSS {mem['peak'] / 2**20:7.1f} MiB"
+          f" (+{mem['delta'] / 1024:.0f} KiB on extraction)")
+
+
+def main():
+    files = sys.argv[1:]
+    pages = load_pages(files)
+    rounds = max(1, 50 // len(pages))
+
+    new_t, new_m = measure(new_extract, pages, rounds), peak("new", files)
+    show("extract_page", new_t, new_m)
+    if BeautifulSoup is None:
+        print("legacy       : skipped (pip install beautifulsoup4)")
+        return
+    old_t, old_m = measure(legacy_extract, pages, rounds), peak("legacy", files)
+    show("legacy", old_t, old_m)
+    print(f"speedup x{old_t / new_t:.2f}, extraction memory +{old_m['delta'] / 1024:.0f}"
+          f" vs +{new_m['delta'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--rss"]:
+        print(json.dumps(child_rss(sys.argv[2], sys.argv[3:])))
+    else:
+        main()
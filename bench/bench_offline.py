@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Офлайн-бенчмарк пайплайна на записанных лентах и страницах.
+
+    python bench/bench_offline.py --record [--fixtures DIR]     # один раз, нужна сеть
+    python bench/bench_offline.py [--fixtures DIR] [--rounds N] [--compare bench/results/X.json]
+
+Фикстуры: DIR/manifest.json {url: {"file": ..., "type": ...}} и сами файлы.
+Если записанных фикстур нет, генерируется синтетический набор.
+
+Все HTTP-запросы бота (ленты, статьи, Bot API) уходят на локальный сервер:
+он отдаёт фикстуру по исходному URL (ETag/304 как у живых лент), а вместо
+Telegram отвечает заглушкой. Замеряются отдельные стадии (feedparser,
+extract_article, guess_category, draw_header_image, сборка дайджеста) и
+сквозные запуски poster/digest с разбивкой из metrics.
+Результат — bench/results/<время>.json, --compare печатает разницу.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "bot"))
+
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+RESULTS = os.path.join(ROOT, "bench", "results")
+ITEMS_PER_FEED = 5
+
+
+# ----------- фикстуры -------------
+
+def _name(url: str, ext: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16] + ext
+
+
+def record(fixtures: str):
+    """Скачивает текущие ленты poster.FEEDS и первые статьи из каждой."""
+    import feedparser
+    import poster
+    from net import session
+
+    manifest = {}
+    os.makedirs(fixtures, exist_ok=True)
+
+    def save(url, resp, ext):
+        fn = _name(url, ext)
+        with open(os.path.join(fixtures, fn), "wb") as f:
+            f.write(resp.content)
+        manifest[url] = {"file": fn, "type": resp.headers.get("content-type", "")}
+
+    for feed in poster.FEEDS:
+        try:
+            r = session().get(feed, timeout=15)
+            r.raise_for_status()
+        except Exception as e:
+            print("skip feed", feed, e)
+            continue
+        save(feed, r, ".xml")
+        for e in feedparser.parse(r.content).entries[:ITEMS_PER_FEED]:
+            link = e.get("link")
+            if not link or link in manifest:
+                continue
+            try:
+                p = session().get(link, timeout=15)
+                p.raise_for_status()
+            except Exception as ex:
+                print("skip page", link, ex)
+                continue
+            save(link, p, ".html")
+        print("recorded", feed)
+    with open(os.path.join(fixtures, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    print(f"{len(manifest)} files -> {fixtures}")
+
+
+SYNTH_SOURCES = ["www.rbc.ru", "tass.ru", "ria.ru", "www.interfax.ru", "lenta.ru"]
+SYNTH_TOPICS = ["Курс доллара", "Ставка ЦБ", "Нефть Brent", "Биржа", "Бюджет"]
+
+
+def synthetic(fixtures: str):
+    """Набор как у живых лент: 5 лент по 5 записей, у каждой — страница с меню и скриптами."""
+    manifest = {}
+    now = datetime.now(timezone.utc)
+
+    def save(url, text, ext, ctype):
+        fn = _name(url, ext)
+        with open(os.path.join(fixtures, fn), "w", encoding="utf-8") as f:
+            f.write(text)
+        manifest[url] = {"file": fn, "type": ctype}
+
+    for si, host in enumerate(SYNTH_SOURCES):
+        items = []
+        for i in range(ITEMS_PER_FEED):
+            topic = SYNTH_TOPICS[(si + i) % len(SYNTH_TOPICS)]
+            title = f"{topic}: новость {si}-{i} о рынке и экономике"
+            link = f"https://{host}/economics/{si}{i:03d}.html"
+            pub = format_datetime(now - timedelta(minutes=17 * i + 5 * si))
+            items.append(f"<item><title>{title}</title><link>{link}</link>"
+                         f"<pubDate>{pub}</pubDate><description>{topic}</description></item>")
+            nav = "".join(f"<li><a href='/r{k}'>Рубрика {k}</a></li>" for k in range(60))
+            body = "".join(
+                f"<p>{topic}, абзац {k}: источник {si}-{i} сообщает, что рынок отреагировал "
+                f"на решения регулятора, аналитики ждут изменения инфляции к концу года.</p>"
+                for k in range(30 + 5 * i)
+            )
+            page = (
+                f"<html><head><meta charset='utf-8'><title>{title}</title>"
+                "<meta property='article:section' content='Экономика'>"
+                f"<meta property='article:published_time' content='{now.isoformat()}'>"
+                + "<script>var x = 1;</script>" * 30
+                + f"</head><body><nav><ul>{nav}</ul></nav><div class='article'><h1>{title}</h1>"
+                f"{body}</div><footer><ul>{nav}</ul></footer></body></html>"
+            )
+            save(link, page, ".html", "text/html; charset=utf-8")
+        rss = ("<?xml version='1.0' encoding='utf-8'?><rss version='2.0'><channel>"
+               f"<title>{host}</title>{''.join(items)}</channel></rss>")
+        save(f"https://{host}/rss", rss, ".xml", "application/rss+xml; charset=utf-8")
+    with open(os.path.join(fixtures, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def load_fixtures(fixtures: str) -> dict:
+    with open(os.path.join(fixtures, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    out = {}
+    for url, rec in manifest.items():
+        with open(os.path.join(fixtures, rec["file"]), "rb") as f:
+            out[url] = (f.read(), rec.get("type") or "")
+    return out
+
+
+# ----------- локальный сервер -------------
+
+class ReplayAdapter(HTTPAdapter):
+    """Переписывает любой внешний URL на локальный сервер, исходный — в X-Orig-Url."""
+
+    def __init__(self, base: str):
+        super().__init__()
+        self.base = base
+
+    def send(self, request, **kw):
+        if not request.url.startswith(self.base):
+            request.headers["X-Orig-Url"] = request.url
+            request.url = self.base + "/replay"
+        return super().send(request, **kw)
+
+
+def start_server(files: dict):
+    tg_log = {"calls": 0, "bytes": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # заголовки и тело уходят отдельными записями — без NODELAY ловим 40 мс задержки ACK
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _reply(self, code, body=b"", ctype="text/plain", headers=None):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            rec = files.get(self.headers.get("X-Orig-Url", ""))
+            if rec is None:
+                return self._reply(404, b"not recorded")
+            body, ctype = rec
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._reply(304, headers={"ETag": etag})
+            self._reply(200, body, ctype, {"ETag": etag})
+
+        def do_POST(self):
+            # заглушка Bot API: /bot<token>/<method>
+            n = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(n)
+            tg_log["calls"] += 1
+            tg_log["bytes"] += n
+            mid = tg_log["calls"]
+            res = {"ok": True, "result": {"message_id": mid, "photo": [{"file_id": f"F{mid}"}]}}
+            self._reply(200, json.dumps(res).encode(), "application/json")
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_port}", tg_log
+
+
+# ----------- замеры -------------
+
+def summary(times: list) -> dict:
+    s = sorted(times)
+    return {
+        "n": len(s),
+        "median_ms": round(statistics.median(s) * 1000, 3),
+        "p95_ms": round(s[min(len(s) - 1, int(len(s) * 0.95))] * 1000, 3),
+        "total_ms": round(sum(s) * 1000, 3),
+    }
+
+
+def timed(fn, *a):
+    t = time.perf_counter()
+    out = fn(*a)
+    return out, time.perf_counter() - t
+
+
+def fresh_state(poster):
+    # состояние бота — в data/ текущего каталога; каждый сквозной прогон с нуля
+    shutil.rmtree("data", ignore_errors=True)
+    os.makedirs("data")
+    poster._posted = poster._feed_cache = poster._neardup = poster._sources = poster._channels = poster._rollup = poster._tg_files = None
+
+
+def bench(files: dict, rounds: int) -> dict:
+    import feedparser
+    import metrics
+    import poster
+    from cover import draw_header_image
+    import digest
+    import rollup
+    import tg
+    from net import session
+
+    srv, base, tg_log = start_server(files)
+    session().mount("http://", ReplayAdapter(base))
+    session().mount("https://", ReplayAdapter(base))
+    tg.API_URL = base
+    tg.CHAT_INTERVAL = 0
+    tg.GLOBAL_RATE = 1e6
+    poster.BOT_TOKEN = digest.BOT_TOKEN = "bench"
+    poster.CHANNEL_IDS = ["@bench"]
+    digest.CHANNEL_ID = "@bench"
+
+    feeds = [u for u, (_, ctype) in files.items() if u.endswith((".xml", "/rss")) or "xml" in ctype]
+    pages = [u for u in files if u not in feeds]
+    poster.FEEDS = feeds
+    stages = {k: [] for k in ("feed_parse", "extract_article", "guess_category",
+                              "draw_header_image", "digest_build")}
+    e2e = {}
+
+    for _ in range(rounds):
+        for u in feeds:
+            stages["feed_parse"].append(timed(feedparser.parse, files[u][0])[1])
+        arts = []
+        for u in pages:
+            (title, body, _cat), dt = timed(poster.extract_article, u)
+            stages["extract_article"].append(dt)
+            arts.append((u, title, body))
+        now = datetime.now(poster.LOCAL_TZ)
+        for u, title, body in arts:
+            cat, dt = timed(poster.guess_category, {}, title, body)
+            stages["guess_category"].append(dt)
+            stages["draw_header_image"].append(
+                timed(draw_header_image, title or "Без заголовка", poster.domain_of(u), cat, now)[1])
+        agg = rollup.Rollup(path=None)
+        for u, t, _ in arts:
+            agg.add(u, t)
+        items = agg.top(time.time() - 8 * 3600, k=digest.DIGEST_ITEMS)
+        stages["digest_build"].append(timed(digest.build_messages, items, timezone.utc)[1])
+
+    # сквозные прогоны: как в CI, с чистым состоянием
+    for _ in range(rounds):
+        fresh_state(poster)
+        with metrics.run("bench_poster") as r:
+            t = time.perf_counter()
+            posted = poster.run_once()
+            poster.flush_state()
+            wall = time.perf_counter() - t
+        e2e.setdefault("poster", []).append(dict(r.report(), wall_s=round(wall, 3), posted=posted))
+        with metrics.run("bench_digest") as r:
+            t = time.perf_counter()
+            digest.build_and_send()
+            wall = time.perf_counter() - t
+        e2e.setdefault("digest", []).append(dict(r.report(), wall_s=round(wall, 3)))
+    srv.shutdown()
+
+    return {
+        "stages": {k: summary(v) for k, v in stages.items() if v},
+        "e2e": {k: {"wall_median_s": statistics.median(x["wall_s"] for x in v), "runs": v}
+                for k, v in e2e.items()},
+        "telegram": tg_log,
+        "fixtures": {"feeds": len(feeds), "pages": len(pages)},
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(old: dict, new: dict):
+    print(f"\n{'stage':<20}{'old ms':>12}{'new ms':>12}{'delta':>9}")
+    rows = [(k, old["stages"].get(k, {}).get("median_ms"), v["median_ms"]) for k, v in new["stages"].items()]
+    rows += [(f"e2e {k}", old["e2e"].get(k, {}).get("wall_median_s"), v["wall_median_s"])
+             for k, v in new["e2e"].items()]
+    for name, a, b in rows:
+        if a and name.startswith("e2e"):
+            a, b = a * 1000, b * 1000
+        delta = f"{(b - a) / a * 100:+.0f}%" if a else "-"
+        print(f"{name:<20}{a if a is not None else '-':>12}{round(b, 3):>12}{delta:>9}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="offline pipeline benchmark")
+    ap.add_argument("--fixtures", default=FIXTURES)
+    ap.add_argument("--record", action="store_true", help="записать фикстуры с живых лент")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--compare", help="предыдущий результат из bench/results")
+    ap.add_argument("--out", default=RESULTS)
+    args = ap.parse_args()
+    fixtures = os.path.abspath(args.fixtures)
+
+    if args.record:
+        record(fixtures)
+        return
+
+    work = tempfile.mkdtemp(prefix="bench_offline_")
+    synth = not os.path.exists(os.path.join(fixtures, "manifest.json"))
+    if synth:
+        fixtures = os.path.join(work, "fixtures")
+        os.makedirs(fixtures)
+        synthetic(fixtures)
+    files = load_fixtures(fixtures)
+
+    # бот пишет состояние в ./data — работаем во временном каталоге
+    os.chdir(work)
+    try:
+        res = bench(files, args.rounds)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work, ignore_errors=True)
+    res.update(when=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               commit=git_rev(), rounds=args.rounds, synthetic=synth)
+
+    print(f"\n{'stage':<20}{'n':>5}{'median ms':>12}{'p95 ms':>10}")
+    for k, v in res["stages"].items():
+        print(f"{k:<20}{v['n']:>5}{v['median_ms']:>12}{v['p95_ms']:>10}")
+    for k, v in res["e2e"].items():
+        print(f"e2e {k:<16} median {v['wall_median_s']:.3f}s")
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{res['commit'] or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=1)
+    print("saved", path)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), res)
+
+
+if __name__ == "__main__":
+    main()
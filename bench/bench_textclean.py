@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность очистки текста: старый фильтр абзацев из
+extract_article + normalize_spaces() против textclean.clean_paragraphs().
+
+    python bench/bench_textclean.py [rounds]
+
+Абзацы — синтетические (обычный текст, «облака тегов», призывы подписаться,
+«Читайте также», повторы). Проверяется и совпадение результата: старый
+код склеивал абзацы в одну строку, поэтому сравниваем без разрывов.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+
+import textclean  # noqa: E402
+
+
+def legacy_normalize_spaces(s: str) -> str:
+    s = s.replace("\xa0", " ")
+    s = " ".join(s.split())
+    s = s.replace(". ", ".§").replace("! ", "!§").replace("? ", "?§")
+    s = s.replace("§", " ")
+    s = s.replace("\n ", "\n")
+    s = s.replace(" ,", ",").replace(" .", ".")
+    return s
+
+
+def legacy_clean(texts) -> str:
+    # копия фильтра абзацев из extract_article до textclean
+    paragraphs = []
+    for t in texts:
+        t = " ".join(t.split())
+        if not t:
+            continue
+        tokens = t.split()
+        if sum(1 for tok in tokens if tok.istitle()) > 12 and len(tokens) > 30:
+            continue
+        if "подписывайтесь" in t.lower() or "телеграм" in t.lower() and "канал" in t.lower():
+            continue
+        if t.lower().startswith(("читайте также", "см. также", "по теме")):
+            continue
+        paragraphs.append(t)
+    body = []
+    seen = set()
+    for t in paragraphs:
+        if t in seen:
+            continue
+        seen.add(t)
+        t = t.replace(" ,", ",").replace(" .", ".")
+        body.append(t)
+    return legacy_normalize_spaces("\n\n".join(body))
+
+
+def new_clean(texts) -> str:
+    return "\n\n".join(textclean.clean_paragraphs(texts))
+
+
+WORDS = ("рынок курс доллар рубль инфляция ставка банк бюджет нефть экспорт "
+         "аналитики ожидают снижение рост неделя торги биржа компания").split()
+CITIES = "Москва Казань Сочи Омск Томск Уфа Пермь Самара Тула Курск Орёл Псков Тверь Чита".split()
+
+
+def synthetic_articles(n: int, rnd: random.Random) -> list:
+    arts = []
+    for _ in range(n):
+        pars = []
+        for k in range(rnd.randint(8, 25)):
+            words = [rnd.choice(WORDS) for _ in range(rnd.randint(15, 60))]
+            words[0] = words[0].capitalize()
+            pars.append("  " + " ".join(words) + " , по данным\xa0ЦБ .\n")
+        pars.insert(2, "Читайте также: доллар дорожает третий день подряд")
+        pars.insert(5, "Подписывайтесь на наш Телеграм-канал")
+        pars.append(" ".join(rnd.choice(CITIES) for _ in range(40)))
+        pars.append(pars[1])
+        arts.append(pars)
+    return arts
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    arts = synthetic_articles(300, random.Random(42))
+    size = sum(len(p.encode("utf-8")) for a in arts for p in a)
+
+    same = sum(legacy_clean(a) == " ".join(new_clean(a).split("\n\n")) for a in arts)
+    print(f"{len(arts)} articles, {size / 1e6:.2f} MB; same output: {same}/{len(arts)}")
+
+    for name, fn in (("legacy", legacy_clean), ("textclean", new_clean)):
+        best = float("inf")
+        for _ in range(rounds):
+            t = time.perf_counter()
+            for a in arts:
+                fn(a)
+            best = min(best, time.perf_counter() - t)
+        print(f"{name:<10}: {best * 1000 / len(arts):7.3f} ms/article, {size / best / 1e6:6.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Рубрика новости по ключевым словам из data/categories.json.
+
+Текст один раз режется на слова; каждое слово — одна проверка по словарю
+(ответы запоминаются), совпадение добавляет очко своей рубрике, слова
+заголовка весят title_weight. Основы (stems) совпадают только с начала
+слова, короткие ключи («ит», «суд») — только целым словом (words).
+Регистр и «ё» приводятся у слова при первой встрече, а не у всего текста;
+фразы ищутся в приведённом тексте, только если встретилось их первое слово.
+"""
+
+import json
+import os
+import re
+import threading
+
+# таблица ключей — часть кода, а не состояние: путь от корня репозитория, а не от cwd
+CATEGORIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "categories.json")
+
+
+def _fold(s: str) -> str:
+    return s.lower().replace("ё", "е")
+
+
+# знаки, которые отрезаем от слова: кавычки, скобки, пунктуация
+_PUNCT = ".,:;!?«»\"'()[]{}—–-…/"
+# сколько разных слов помним (словарь новостей за месяцы работы — десятки тысяч)
+MEMO_SIZE = 200000
+# ответ для первого слова фразы: _HEAD + 1 + рубрика самого слова (или -1)
+_HEAD = 1 << 16
+
+
+class Classifier:
+    def __init__(self, table: dict):
+        self.default = table.get("default", "Общество")
+        self.title_weight = table.get("title_weight", 3)
+        self.body_chars = table.get("body_chars", 400)
+        self.title_lead = table.get("title_lead", 2)
+        self.names = [cat["name"] for cat in table["categories"]]
+        # слово -> рубрика; основа -> рубрика (по длинам основ); фразы из нескольких слов
+        self.words, self.stems, self.phrases, self.heads = {}, {}, [], set()
+        aliases = []
+        for i, cat in enumerate(table["categories"]):
+            for w in map(_fold, cat.get("words", [])):
+                if " " in w:
+                    self.phrases.append((w, i))
+                    self.heads.add(w.split()[0])
+                else:
+                    self.words.setdefault(w, i)
+            for w in map(_fold, cat.get("stems", [])):
+                self.stems.setdefault(w, i)
+            al = sorted({_fold(a) for a in cat.get("aliases", []) + [cat["name"]]}, key=len, reverse=True)
+            aliases.append(r"(?P<c%d>%s)" % (i, "|".join(map(re.escape, al))))
+        # длинные основы проверяем первыми: «рынок» раньше «рын»
+        self.stem_lens = sorted({len(w) for w in self.stems}, reverse=True)
+        # рубрика — целым словом: «мир» не должен находиться в «Мировая экономика», «sport» — в «Transport»
+        self.aliases = re.compile(r"(?<!\w)(?:%s)(?!\w)" % "|".join(aliases))
+        # слово как в тексте -> рубрика или -1
+        self._memo = {}
+
+    def category_of(self, token: str) -> int:
+        """Рубрика слова как в тексте (регистр, пунктуация) или -1; для начала фразы — _HEAD + 1 + рубрика."""
+        c = self._memo.get(token)
+        if c is None:
+            word = _fold(token).strip(_PUNCT)
+            c = self.words.get(word, -1)
+            if c < 0:
+                for n in self.stem_lens:
+                    if n <= len(word):
+                        c = self.stems.get(word[:n], -1)
+                        if c >= 0:
+                            break
+            if word in self.heads:
+                c += _HEAD + 1
+            if len(self._memo) < MEMO_SIZE:
+                self._memo[token] = c
+        return c
+
+    def scores(self, title: str, body: str = "") -> list:
+        score = [0] * len(self.names)
+        self._add(score, title, self.title_weight)
+        # заголовок уже решил (title_lead слов за одну рубрику, у других ни одного) —
+        # текст не читаем: на нём уходит больше всего времени, а исход он не меняет
+        best = max(score)
+        if body and not (best >= self.title_lead * self.title_weight and sum(score) == best):
+            self._add(score, body[:self.body_chars], 1)
+        return score
+
+    def _add(self, score: list, text: str, weight: int):
+        if not text:
+            return
+        memo = self._memo
+        head = False
+        # split() и словарь быстрее регулярного выражения по словам
+        for tok in text.split():
+            c = memo.get(tok)
+            if c is None:
+                c = self.category_of(tok)
+            if c >= 0:
+                if c >= _HEAD:
+                    head = True
+                    c -= _HEAD + 1
+                    if c < 0:
+                        continue
+                score[c] += weight
+        if head:
+            low = _fold(text)
+            for phrase, c in self.phrases:
+                if phrase in low:
+                    score[c] += weight
+
+    def guess(self, title: str, body: str = "") -> str:
+        score = self.scores(title, body)
+        best = max(score)
+        # ничья — в пользу рубрики выше в таблице (index() берёт первую)
+        return self.names[score.index(best)] if best else self.default
+
+    def simplify(self, s: str, default: str = None) -> str:
+        """Рубрика сайта (метатег) -> наша; неизвестная — default (по умолчанию из таблицы)."""
+        m = self.aliases.search(_fold(s.strip()))
+        if m:
+            return self.names[int(m.lastgroup[1:])]
+        return self.default if default is None else default
+
+
+_classifier = None
+_lock = threading.Lock()
+
+
+def classifier(path: str = CATEGORIES_FILE) -> Classifier:
+    global _classifier
+    with _lock:
+        if _classifier is None:
+            with open(path, "r", encoding="utf-8") as f:
+                _classifier = Classifier(json.load(f))
+        return _classifier
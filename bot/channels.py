@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Каналы: у каждого свои ленты, фильтр рубрик, бренд и частота постов.
+
+Настройка — data/channels.json (путь можно сменить через CHANNELS_FILE):
+
+    {"channels": [
+      {"id": "@usdtdollarm"},
+      {"id": "@my_econ", "feeds": ["https://www.rbc.ru/rss/?rss=news"],
+       "categories": ["Экономика"], "brand": "Econ", "brand_url": "https://t.me/my_econ",
+       "min_gap": 1800}
+    ]}
+
+Без файла каналы берутся из CHANNEL_ID (через запятую) с общими настройками.
+"""
+
+import json
+import os
+
+CHANNELS_FILE = os.getenv("CHANNELS_FILE", os.path.join("data", "channels.json"))
+# бренд по умолчанию: шапка обложки, подпись поста, подвал дайджеста
+BRAND = "USDT=Dollar"
+BRAND_URL = "https://t.me/usdtdollarm"
+
+
+class Channel:
+    def __init__(self, id: str, feeds=None, categories=None, exclude_categories=None,
+                 brand: str = BRAND, brand_url: str = BRAND_URL, min_gap: float = None):
+        self.id = str(id)
+        # пустой список/None — все ленты и все рубрики
+        self.feeds = tuple(feeds or ())
+        self.categories = set(categories or ())
+        self.exclude = set(exclude_categories or ())
+        self.brand = brand
+        self.brand_url = brand_url
+        # минимальный интервал между постами, сек; None — по режиму запуска
+        self.min_gap = min_gap
+
+    def __repr__(self):
+        return f"Channel({self.id})"
+
+    def takes_feed(self, feeds) -> bool:
+        """feeds — ленты, в которых пришла статья (None — не из ленты, годится всем)."""
+        if not self.feeds or not feeds:
+            return True
+        if isinstance(feeds, str):
+            feeds = (feeds,)
+        return any(f in self.feeds for f in feeds)
+
+    def takes_category(self, category: str) -> bool:
+        if category in self.exclude:
+            return False
+        return not self.categories or category in self.categories
+
+
+def load(default_ids, path: str = CHANNELS_FILE) -> list:
+    """Каналы из файла; без файла — по одному на каждый id из CHANNEL_ID."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [Channel(**c) for c in data.get("channels", [])]
+    return [Channel(c) for c in default_ids]
+
+
+def all_feeds(channels, default_feeds) -> list:
+    """Объединение лент всех каналов, без повторов; канал без списка берёт default_feeds."""
+    out = []
+    for ch in channels:
+        for url in (ch.feeds or default_feeds):
+            if url not in out:
+                out.append(url)
+    return out
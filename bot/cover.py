@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+Обложки постов: фон, логотип, бейджи и заголовок.
+"""
+
+import hashlib
+import os
+import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from datetime import datetime
+from io import BytesIO
+from statistics import NormalDist
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageFilter
+
+# название канала в шапке обложки (у каналов из data/channels.json может быть своё)
+from channels import BRAND
+
+# используем системные DejaVu — они есть в GHA runner
+FONT_PATHS = {
+    False: ["/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+            "/usr/share/fonts/truetype/freefont/FreeSans.ttf"],
+    True: ["/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+           "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf"],
+}
+
+# кегли заголовка: от крупного к мелкому с шагом 2
+TITLE_MIN_SIZE = 20
+
+
+@lru_cache(maxsize=None)
+def font_path(bold=False):
+    for p in FONT_PATHS[bool(bold)]:
+        if os.path.exists(p):
+            return p
+    return None
+
+
+@lru_cache(maxsize=None)
+def _load_font(path, size: int):
+    if path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(path, size=size)
+
+
+def try_font(size: int, bold=False) -> ImageFont.FreeTypeFont:
+    # реестр шрифтов: один объект на (путь, кегль, насыщенность)
+    return _load_font(font_path(bold), size)
+
+
+@lru_cache(maxsize=65536)
+def text_width(font, text: str) -> float:
+    # ширина с учётом продвижения курсора — складывается по словам
+    try:
+        return font.getlength(text)
+    except AttributeError:
+        return font.getsize(text)[0]
+
+
+@lru_cache(maxsize=16384)
+def text_height(font, text: str) -> int:
+    try:
+        bbox = font.getbbox(text)
+        return bbox[3] - bbox[1]
+    except AttributeError:
+        return font.getsize(text)[1]
+
+
+def badge_size(draw, text, font, pad=(14, 8)):
+    w, h = text_size(draw, text, font)
+    return w + pad[0]*2, h + pad[1]*2
+
+
+def draw_badge(draw: ImageDraw.ImageDraw, xy, text, font, pad=(14, 8), fill=(40, 40, 40), fg=(230, 230, 230)):
+    x, y = xy
+    rw, rh = badge_size(draw, text, font, pad)
+    radius = rh // 2
+    rect = [x, y, x+rw, y+rh]
+    rounded(draw, rect, radius, fill)
+    draw.text((x+pad[0], y+pad[1]), text, font=font, fill=fg)
+    return rw, rh
+
+
+def rounded(draw, rect, r, color):
+    (x1, y1, x2, y2) = rect
+    # Pillow 9.x падает, если диаметр на 1px меньше высоты — рисуем «таблетку» явно
+    if 2 * r >= y2 - y1 - 1:
+        r = (y2 - y1 + 1) // 2
+    draw.rounded_rectangle(rect, radius=r, fill=color)
+
+
+def text_size(draw, text, font):
+    # совместимость разных версий Pillow
+    try:
+        bbox = draw.textbbox((0,0), text, font=font)
+        return (bbox[2]-bbox[0], bbox[3]-bbox[1])
+    except Exception:
+        return draw.textsize(text, font=font)
+
+
+def wrap_words(text: str, font, width) -> list:
+    """Перенос по словам; ширины слов берутся из кеша, строка не перемеряется."""
+    space = text_width(font, " ")
+    lines, line, lw = [], [], 0.0
+    for word in text.split():
+        ww = text_width(font, word)
+        if line and lw + space + ww > width:
+            lines.append(" ".join(line))
+            line, lw = [], 0.0
+        # слово длиннее строки остаётся на своей строке целиком
+        lw = ww if not line else lw + space + ww
+        line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def layout_title(text: str, size: int, width, line_spacing=6, max_lines=4):
+    """Строки и высота блока для заданного кегля."""
+    f = try_font(size, bold=True)
+    lines = wrap_words(text, f, width)
+
+    # урежем по числу строк
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        # добавим многоточие к последней
+        if not lines[-1].endswith("…"):
+            lines[-1] = lines[-1].rstrip(".,;: ") + "…"
+
+    heights = [text_height(f, ln) for ln in lines]
+    total = sum(heights) + line_spacing * (len(lines) - 1)
+    return f, lines, heights, total
+
+
+def fit_title(text: str, max_size: int, width, height, line_spacing=6, max_lines=4):
+    """
+    Вёрстка с наибольшим кеглем (шаг 2, не меньше TITLE_MIN_SIZE), который
+    влезает по высоте, или None. Обычно заголовок влезает сразу — проверяем
+    верхний кегль, иначе бинарный поиск (чем мельче, тем ниже блок).
+    """
+    sizes = list(range(max_size, TITLE_MIN_SIZE - 1, -2))[::-1]
+    top = layout_title(text, sizes[-1], width, line_spacing, max_lines)
+    if top[3] <= height:
+        return top
+    best = None
+    lo, hi = 0, len(sizes) - 2
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        res = layout_title(text, sizes[mid], width, line_spacing, max_lines)
+        if res[3] <= height:
+            best, lo = res, mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def draw_multiline_fit(draw, text, font, box, fill=(255,255,255), line_spacing=6, max_lines=4):
+    """
+    Впишем текст в прямоугольник: уменьшаем кегль, переносим строки.
+    """
+    x, y, w, h = box
+    best = fit_title(text, font.size, w, h, line_spacing, max_lines)
+
+    if best is None:
+        # если не вписался — рисуем мелко
+        f = try_font(TITLE_MIN_SIZE, bold=True)
+        draw.text((x, y), text[:80] + "…", font=f, fill=fill)
+        return
+
+    f, lines, heights, total = best
+    cy = y + (h - total) // 2
+    for ln, th in zip(lines, heights):
+        draw.text((x, cy), ln, font=f, fill=fill)
+        cy += th + line_spacing
+
+
+# версия рисовалки: меняется — старые обложки в кеше не подходят
+RENDER_VERSION = 1
+
+# кодирование: формат (jpeg | webp) и потолок размера файла; качество подбирается
+# наибольшее из COVER_QUALITIES, при котором файл влезает в COVER_MAX_BYTES
+COVER_FORMAT = os.getenv("COVER_FORMAT", "jpeg").lower()
+COVER_MAX_BYTES = int(os.getenv("COVER_MAX_BYTES", str(80 * 1024)))
+COVER_QUALITIES = (92, 88, 84, 80, 76, 72)
+# формат -> (имя в Pillow, расширение, mime, параметры save)
+_FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"optimize": True}),
+    "webp": ("WEBP", "webp", "image/webp", {"method": 4}),
+}
+
+# кеш готовых обложек по хешу содержимого (пусто — без кеша)
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", os.path.join("data", "cover_cache"))
+COVER_CACHE_MAX = int(os.getenv("COVER_CACHE_MAX", "500"))
+
+# фирменная палитра
+PALETTES = [
+    ((18,22,27), (34,43,54)),   # графит -> стальной
+    ((20,24,30), (52,31,69)),   # графит -> фиолетово-синий
+    ((17,24,21), (20,55,43)),   # графит -> изумруд
+    ((24,24,24), (62,62,62)),   # тёмный моно
+]
+
+# сколько вариантов пятен держим на палитру и сколько фонов — в памяти
+BG_VARIANTS = int(os.getenv("BG_VARIANTS", "4"))
+BG_CACHE_SIZE = int(os.getenv("BG_CACHE_SIZE", "16"))
+# дисковый кеш готовых фонов (пусто — только память)
+BG_CACHE_DIR = os.getenv("BG_CACHE_DIR", os.path.join("data", "bg_cache"))
+
+# пятна размываются в уменьшенном виде, затем растягиваются — блюр на весь кадр не нужен
+_SPOT_SCALE = 8
+_SPOT_LUT = [int(p * 0.35) for p in range(256)]
+# шум: равномерные байты из сидированного rng -> гауссиана N(128, 4) -> * 0.07
+# (как effect_noise(size, 4), но воспроизводимо)
+_NOISE_LUT = [int(NormalDist(128, 4).inv_cdf((p + 0.5) / 256) * 0.07) for p in range(256)]
+
+_bg_cache: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+
+
+def render_background(size, palette: int, variant: int) -> Image.Image:
+    """
+    Спокойный градиент с мягкими пятнами. Детерминирован по (palette, variant).
+    """
+    w, h = size
+    rng = random.Random(f"bg:{palette}:{variant}")
+    c1, c2 = PALETTES[palette]
+
+    # вертикальный мягкий градиент: маска 0..255 сверху вниз
+    grad = Image.linear_gradient("L").resize(size, Image.BILINEAR)
+    img = Image.composite(Image.new("RGB", size, c2), Image.new("RGB", size, c1), grad)
+
+    # soft-spot акценты: все пятна в одной маске
+    k = _SPOT_SCALE
+    sw, sh = max(1, w // k), max(1, h // k)
+    mask = Image.new("L", (sw, sh), 0)
+    for _ in range(rng.randint(2, 3)):
+        sx = rng.randint(int(0.2*w), int(0.8*w)) / k
+        sy = rng.randint(int(0.2*h), int(0.8*h)) / k
+        sr = rng.randint(int(0.12*h), int(0.22*h)) / k
+        spot = Image.new("L", (sw, sh), 0)
+        ImageDraw.Draw(spot).ellipse((sx-sr, sy-sr, sx+sr, sy+sr), fill=rng.randint(60, 110))
+        mask = ImageChops.add(mask, spot.filter(ImageFilter.GaussianBlur(radius=0.07*h/k)))
+    mask = mask.resize(size, Image.BILINEAR).point(_SPOT_LUT)
+    # осветление
+    img = Image.composite(Image.new("RGB", size, (240,240,240)), img, mask)
+
+    # лёгкий шум
+    noise = Image.frombytes("L", size, rng.randbytes(w * h)).point(_NOISE_LUT)
+    img = Image.composite(img, Image.new("RGB", size, (0,0,0)), noise)
+    return img
+
+
+def _bg_path(size, palette, variant):
+    return os.path.join(BG_CACHE_DIR, f"bg_{size[0]}x{size[1]}_{palette}_{variant}.png")
+
+
+def get_background(size, palette: int, variant: int) -> Image.Image:
+    """
+    Фон из LRU-кеша в памяти, затем с диска, иначе рендерим и сохраняем.
+    Возвращается копия — её можно рисовать.
+    """
+    key = (tuple(size), palette, variant)
+    img = _bg_cache.get(key)
+    if img is not None:
+        _bg_cache.move_to_end(key)
+        return img.copy()
+
+    path = _bg_path(size, palette, variant) if BG_CACHE_DIR else None
+    if path and os.path.exists(path):
+        try:
+            img = Image.open(path)
+            img.load()
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+        except Exception:
+            img = None
+    if img is None:
+        img = render_background(size, palette, variant)
+        if path:
+            try:
+                os.makedirs(BG_CACHE_DIR, exist_ok=True)
+                img.save(path, format="PNG")
+            except OSError:
+                pass
+
+    _bg_cache[key] = img
+    while len(_bg_cache) > BG_CACHE_SIZE:
+        _bg_cache.popitem(last=False)
+    return img.copy()
+
+
+def warm_backgrounds(size=(1280, 640)):
+    """Заранее готовит весь пул фонов (для долгоживущего процесса)."""
+    for p in range(len(PALETTES)):
+        for v in range(BG_VARIANTS):
+            get_background(size, p, v)
+
+
+def make_background(size=(1280, 640), rng: random.Random = None) -> Image:
+    """Случайный фон из пула предрендеренных."""
+    rng = rng or random
+    return get_background(size, rng.randrange(len(PALETTES)), rng.randrange(BG_VARIANTS))
+
+
+def cover_key(title: str, src_domain: str, category: str, post_dt: datetime, brand: str = BRAND) -> str:
+    """Хеш содержимого обложки: одинаковые входные данные — одинаковая картинка."""
+    parts = [str(RENDER_VERSION), title, src_domain, category or "", post_dt.strftime("%d.%m %H:%M")]
+    if brand != BRAND:
+        # бренд по умолчанию в ключ не входит — прежние ключи кеша остаются в силе
+        parts.append(brand)
+    raw = "\x1f".join(parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def draw_header_image(title: str, src_domain: str, category: str, post_dt: datetime,
+                      brand: str = BRAND) -> BytesIO:
+    W, H = 1280, 640
+    # фон выбирается детерминированно по содержимому
+    rng = random.Random(cover_key(title, src_domain, category, post_dt, brand))
+    img = make_background((W, H), rng)
+    draw = ImageDraw.Draw(img)
+
+    # Логотип
+    # кружок
+    circle_r = 30
+    cx, cy = 64, 64
+    draw.ellipse((cx-circle_r, cy-circle_r, cx+circle_r, cy+circle_r), fill=(230,230,230))
+    # $ по центру
+    sym_font = try_font(42, bold=True)
+    dollar = "$"
+    tw, th = text_size(draw, dollar, sym_font)
+    draw.text((cx - tw//2, cy - th//2 + 1), dollar, font=sym_font, fill=(40,40,40))
+    # название
+    name_font = try_font(42, bold=True)
+    draw.text((cx + circle_r + 18, cy - 22), brand, font=name_font, fill=(240,240,240))
+
+    # Бейджи справа — сначала «пост: дата», ниже — категория
+    badge_font = try_font(26, bold=False)
+    date_text = post_dt.strftime("пост: %d.%m %H:%M")
+    # сначала меряем: бейдж выравнивается по правому краю
+    b1w, b1h = badge_size(draw, date_text, badge_font)
+    draw_badge(draw, (W-10-b1w, 18), date_text, badge_font, fill=(72, 78, 84), fg=(240,240,240))
+    cat_text = category if category else "Новости"
+    b2w, b2h = draw_badge(draw, (W-10-b1w, 18+b1h+12), cat_text, badge_font, fill=(62, 118, 164), fg=(255,255,255))
+
+    # Подложка для заголовка: непрозрачная, так что рисуем прямо в RGB
+    # (полупрозрачный чёрный поверх чёрного через RGBA ничего не менял)
+    pad = 26
+    box = (26, 150, W-26, H-120)
+    rounded(draw, (box[0], box[1], box[2], box[3]), 28, (0,0,0,))  # затемнение
+
+    title_font = try_font(64, bold=True)
+    draw_multiline_fit(
+        draw,
+        title,
+        title_font,
+        (box[0]+pad, box[1]+pad, box[2]-box[0]-pad*2, box[3]-box[1]-pad*2),
+        fill=(255,255,255),
+        max_lines=4
+    )
+
+    # Нижние подписи
+    small = try_font(26)
+    draw.text((32, H-44), f"source: {src_domain}", font=small, fill=(210,210,210))
+
+    return BytesIO(encode(img))
+
+
+# ----------- КОДИРОВАНИЕ -------------
+
+def cover_mime(fmt: str = None) -> tuple:
+    """(имя файла, mime) обложки для загрузки."""
+    _, ext, mime, _ = _FORMATS[fmt or COVER_FORMAT]
+    return f"cover.{ext}", mime
+
+
+def encode(img: Image.Image, fmt: str = None, budget: int = None) -> bytes:
+    """
+    Картинка -> байты в COVER_FORMAT. Первое кодирование — с лучшим качеством
+    (обычно уже влезает); иначе бинарный поиск по COVER_QUALITIES. Если не
+    влезает и худшее — отдаём худшее.
+    """
+    name, _, _, opts = _FORMATS[fmt or COVER_FORMAT]
+    budget = budget or COVER_MAX_BYTES
+
+    def save(q):
+        out = BytesIO()
+        img.save(out, format=name, quality=q, **opts)
+        return out.getvalue()
+
+    data = save(COVER_QUALITIES[0])
+    if len(data) <= budget:
+        return data
+    # размер падает вместе с качеством: ищем первое подходящее
+    tried = {}
+    lo, hi = 1, len(COVER_QUALITIES) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        tried[mid] = save(COVER_QUALITIES[mid])
+        if len(tried[mid]) <= budget:
+            hi = mid
+        else:
+            lo = mid + 1
+    return tried.get(lo) or save(COVER_QUALITIES[lo])
+
+
+# ----------- ПАКЕТНЫЙ РЕНДЕР -------------
+
+def _cover_path(key: str) -> str:
+    # настройки кодирования — часть ключа: сменили формат или потолок — другие файлы
+    _, ext, _, _ = _FORMATS[COVER_FORMAT]
+    return os.path.join(COVER_CACHE_DIR, f"{key}-{COVER_MAX_BYTES}.{ext}")
+
+
+def render_cover(job) -> bytes:
+    """job = (title, src_domain, category, post_dt[, brand]) -> байты обложки."""
+    return draw_header_image(*job).getvalue()
+
+
+def _prune_cover_cache():
+    try:
+        files = [os.path.join(COVER_CACHE_DIR, n) for n in os.listdir(COVER_CACHE_DIR)]
+    except OSError:
+        return
+    if len(files) <= COVER_CACHE_MAX:
+        return
+    files.sort(key=os.path.getmtime)
+    for p in files[: len(files) - COVER_CACHE_MAX]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def render_covers(jobs, workers: int = None) -> list:
+    """
+    Пакетный рендер обложек в пуле процессов (Pillow держит GIL почти всё время).
+    Возвращает байты обложек в порядке jobs; готовые берутся из кеша по хешу.
+    """
+    jobs = list(jobs)
+    keys = [cover_key(*job) for job in jobs]
+    out = [None] * len(jobs)
+    todo = []
+    for i, key in enumerate(keys):
+        path = _cover_path(key) if COVER_CACHE_DIR else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                out[i] = f.read()
+        else:
+            todo.append(i)
+
+    if todo:
+        if len(todo) == 1 or workers == 1:
+            rendered = [render_cover(jobs[i]) for i in todo]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rendered = list(pool.map(render_cover, [jobs[i] for i in todo], chunksize=4))
+        for i, data in zip(todo, rendered):
+            out[i] = data
+            if COVER_CACHE_DIR:
+                try:
+                    os.makedirs(COVER_CACHE_DIR, exist_ok=True)
+                    with open(_cover_path(keys[i]), "wb") as f:
+                        f.write(data)
+                except OSError:
+                    pass
+        if COVER_CACHE_DIR:
+            _prune_cover_cache()
+    return out
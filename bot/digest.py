@@ -1,80 +1,125 @@
-import os, json, pathlib
+import os, pathlib, argparse
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
-import requests
+import tg
+import metrics
+import channels
+import rollup
+from store import EventLog, parse_ts
 
 BOT_TOKEN  = os.environ.get("BOT_TOKEN")
 CHANNEL_ID = os.environ.get("CHANNEL_ID", "@usdtdollarm")
 TIMEZONE   = os.environ.get("TIMEZONE", "Europe/Moscow")
+# окно и сколько новостей в дайджесте; длинный дайджест уходит несколькими сообщениями
+DIGEST_WINDOW_HOURS = float(os.environ.get("DIGEST_WINDOW_HOURS", "8"))
+DIGEST_ITEMS = int(os.environ.get("DIGEST_ITEMS", "18"))
+# предел длины сообщения Telegram
+TG_TEXT_LIMIT = 4096
 
 DATA_DIR = pathlib.Path("data"); DATA_DIR.mkdir(parents=True, exist_ok=True)
-HISTORY_FILE = DATA_DIR / "history.json"
-STATE_FILE   = DATA_DIR / "digest_state.json"
-
-def load_json(p, default):
-    if p.exists():
-        try:
-            return json.loads(p.read_text(encoding="utf-8"))
-        except Exception:
-            return default
-    return default
-
-def save_json(p, data):
-    p.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-
-def send_message(text):
-    url=f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    r=requests.post(url, data={"chat_id": CHANNEL_ID, "text": text, "parse_mode":"Markdown"})
-    print("Telegram:", r.status_code, r.text[:120]); r.raise_for_status()
-
-def main():
-    hist = load_json(HISTORY_FILE, [])
-    state = load_json(STATE_FILE, {"last_digest_utc": None})
+EVENTS_FILE = DATA_DIR / "events.jsonl"
+
+@metrics.timed("telegram")
+def send_message(texts):
+    # texts: {chat_id: [часть, ...]} — у каждого канала свой дайджест; части — по порядку,
+    # каналы — параллельно; лимиты и повторы — в общем клиенте
+    client = tg.client(BOT_TOKEN)
+    res = {}
+    for i in range(max(map(len, texts.values()), default=0)):
+        futures = {chat: client.pool.submit(client.send_message, chat, parts[i], "Markdown")
+                   for chat, parts in texts.items() if i < len(parts) and not isinstance(res.get(chat), Exception)}
+        for chat, fut in futures.items():
+            try:
+                res[chat] = fut.result()
+            except Exception as e:
+                res[chat] = e
+    for chat, r in res.items():
+        if isinstance(r, Exception):
+            metrics.error("telegram", r, chat=chat)
+        else:
+            print("Telegram:", chat, "ok")
+    errors = [r for r in res.values() if isinstance(r, Exception)]
+    if errors and len(errors) == len(res): raise errors[0]
+
+def main(hours=DIGEST_WINDOW_HOURS, category=None):
+    with metrics.run("digest"):
+        build_and_send(hours, category)
+
+def build_and_send(hours=DIGEST_WINDOW_HOURS, category=None):
+    log = EventLog(str(EVENTS_FILE))
     now_utc = datetime.now(timezone.utc)
     tz = ZoneInfo(TIMEZONE)
 
-    window_start = now_utc - timedelta(hours=8)
-
-    last = state.get("last_digest_utc")
-    if last:
-        last_dt = datetime.fromisoformat(last)
-        if last_dt >= window_start:
-            print("Digest already done for this window.")
-            return
+    window_start = now_utc - timedelta(hours=hours)
 
-    items = []
-    for it in hist:
-        try:
-            posted = datetime.fromisoformat(it["posted_utc"])
-            if posted >= window_start:
-                items.append(it)
-        except Exception:
-            continue
+    # повтор того же дайджеста (окно и рубрика) в пределах окна не шлём
+    last = log.last("digest")
+    if last and parse_ts(last["ts"]) >= window_start \
+            and last.get("hours", 8) == hours and last.get("category") == category:
+        print("Digest already done for this window.")
+        return
 
-    if not items:
+    # агрегат ведёт постер; журнал читается, только если агрегата ещё нет
+    with metrics.timer("digest.read"):
+        agg = rollup.load(log)
+    texts, total = {}, 0
+    with metrics.timer("digest.build"):
+        for ch in channels.load(tg.parse_chat_ids(CHANNEL_ID)):
+            items = agg.top(window_start.timestamp(), now_utc.timestamp(), DIGEST_ITEMS,
+                            category=category, chat=ch.id)
+            total = max(total, len(items))
+            if items:
+                texts[ch.id] = build_messages(items, tz, hours, category, ch.brand, ch.brand_url)
+    metrics.incr("items", total)
+
+    if not texts:
         print("No items for digest.")
-        state["last_digest_utc"]=now_utc.isoformat(); save_json(STATE_FILE, state)
+        log.append("digest", ts=now_utc, items=0, hours=hours, category=category)
         return
 
-    items.sort(key=lambda x: x["posted_utc"], reverse=True)
-
-    lines = ["*Дайджест за 8 часов*"]
-    for it in items[:18]:  # ограничим, чтобы не упереться в лимит
-        ev = datetime.fromisoformat(it["event_utc"]).astimezone(tz).strftime("%d.%m %H:%M")
-        title = it["title"]
-        link = it["link"]
-        lines.append(f"• {title}  — [{ev}]({link})")
-
-    lines.append("")
-    lines.append("🪙 [USDT=Dollar](https://t.me/usdtdollarm)")
-
-    text = "\n".join(lines)
-    if len(text) > 4000:
-        text = text[:3996] + "…"
-
-    send_message(text)
-    state["last_digest_utc"] = now_utc.isoformat()
-    save_json(STATE_FILE, state)
+    send_message(texts)
+    log.append("digest", ts=now_utc, items=total, hours=hours, category=category)
+
+def window_title(hours, category=None):
+    h = int(hours) if float(hours).is_integer() else hours
+    if h == 24:
+        span = "сутки"
+    elif h == 1:
+        span = "час"
+    elif isinstance(h, int) and h % 10 in (2, 3, 4) and h % 100 not in (12, 13, 14):
+        span = f"{h} часа"
+    elif isinstance(h, int) and h % 10 == 1 and h % 100 != 11:
+        span = f"{h} час"
+    else:
+        span = f"{h} часов"
+    return f"*Дайджест за {span}*" + (f" · {category}" if category else "")
+
+def build_messages(items, tz, hours=DIGEST_WINDOW_HOURS, category=None,
+                   brand=channels.BRAND, brand_url=channels.BRAND_URL):
+    """Дайджест частями не длиннее TG_TEXT_LIMIT; режем только между строками."""
+    # отобраны по оценке, показываем по времени
+    items = sorted(items, key=lambda x: x["ts"], reverse=True)
+
+    lines = []
+    for it in items:
+        ev = it.get("event_utc")
+        ev = parse_ts(ev) if ev else datetime.fromtimestamp(it["ts"], timezone.utc)
+        lines.append(f"• {it['title']}  — [{ev.astimezone(tz).strftime('%d.%m %H:%M')}]({it['link']})")
+
+    footer = f"\n\n🪙 [{brand}]({brand_url})"
+    parts, cur = [], window_title(hours, category)
+    for line in lines:
+        if len(cur) + 1 + len(line) > TG_TEXT_LIMIT - len(footer):
+            parts.append(cur)
+            cur = line
+        else:
+            cur += "\n" + line
+    parts.append(cur + footer)
+    return parts
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="USDT=Dollar digest")
+    ap.add_argument("--hours", type=float, default=DIGEST_WINDOW_HOURS, help="окно дайджеста, часов")
+    ap.add_argument("--category", help="только эта рубрика")
+    args = ap.parse_args()
+    main(args.hours, args.category)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная загрузка RSS-лент.
+Каждая лента ограничена своим дедлайном, весь проход — общим;
+записи отдаются по мере готовности лент, а не после последней.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from urllib.parse import urlparse
+
+import feedparser
+
+from net import session
+import metrics
+
+# дедлайн на одну ленту (соединение + чтение целиком), сек
+FEED_TIMEOUT = float(os.getenv("FEED_TIMEOUT", "8"))
+# дедлайн на весь проход по лентам, сек
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "20"))
+# число потоков и одновременных запросов к одному хосту
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST", "2"))
+
+# кеш валидаторов (ETag / Last-Modified) между запусками
+CACHE_FILE = os.path.join("data", "feed_cache.json")
+# сколько записей ленты держим в кеше (берём всё равно первые 5)
+CACHE_ENTRIES = 10
+# поля с полным текстом статьи в некоторых лентах (РБК, Яндекс-формат)
+FULLTEXT_KEYS = ("rbc_news_full-text", "yandex_full-text", "full-text")
+
+_host_locks: dict[str, threading.BoundedSemaphore] = {}
+_host_guard = threading.Lock()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_guard:
+        sem = _host_locks.get(host)
+        if sem is None:
+            sem = _host_locks[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+    return sem
+
+
+class FeedCache:
+    """
+    Персистентный кеш лент: валидаторы для условного GET и
+    сжатая копия записей, чтобы на 304 не качать и не парсить ленту заново.
+    """
+
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {"hit": 0, "miss": 0, "unchanged": 0, "bytes": 0, "bytes_saved": 0}
+        self.feeds = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.feeds = json.load(f)
+            except Exception:
+                self.feeds = {}
+
+    def request_headers(self, url: str) -> dict:
+        rec = self.feeds.get(url) or {}
+        headers = {}
+        if rec.get("etag"):
+            headers["If-None-Match"] = rec["etag"]
+        if rec.get("modified"):
+            headers["If-Modified-Since"] = rec["modified"]
+        return headers
+
+    def hit(self, url: str):
+        rec = self.feeds[url]
+        with self.lock:
+            self.stats["hit"] += 1
+            self.stats["bytes_saved"] += rec.get("size", 0)
+        return _as_parsed(rec.get("entries", []), status=304)
+
+    def store(self, url: str, resp_headers: dict, raw: bytes, parsed):
+        entries = []
+        for e in parsed.entries[:CACHE_ENTRIES]:
+            rec = {"link": e.get("link") or "", "title": e.get("title") or "", "published": e.get("published") or ""}
+            # полный текст из ленты нужен быстрому пути извлечения и после 304
+            for key in FULLTEXT_KEYS:
+                if e.get(key):
+                    rec[key] = e[key]
+            if e.get("content"):
+                rec["content"] = [{"value": c.get("value", "")} for c in e["content"][:1]]
+            entries.append(rec)
+        digest = hashlib.sha1(
+            "\n".join(e["link"] + "\t" + e["title"] for e in entries).encode("utf-8")
+        ).hexdigest()
+        with self.lock:
+            prev = self.feeds.get(url) or {}
+            self.stats["miss"] += 1
+            self.stats["bytes"] += len(raw)
+            if prev.get("digest") == digest:
+                # сервер не умеет 304, но содержимое то же
+                self.stats["unchanged"] += 1
+            self.feeds[url] = {
+                "etag": resp_headers.get("etag"),
+                "modified": resp_headers.get("last-modified"),
+                "digest": digest,
+                "size": len(raw),
+                "entries": entries,
+            }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.feeds, ensure_ascii=False)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+def _as_parsed(entries, status=200):
+    return feedparser.FeedParserDict(
+        status=status,
+        entries=[feedparser.FeedParserDict(e) for e in entries],
+    )
+
+
+def _read_until(resp, deadline: float) -> bytes:
+    # requests.timeout ограничивает паузы между пакетами, а не весь ответ —
+    # поэтому читаем кусками и сами следим за временем
+    chunks = []
+    for chunk in resp.iter_content(chunk_size=16384):
+        chunks.append(chunk)
+        if time.monotonic() > deadline:
+            raise TimeoutError("feed deadline exceeded")
+    return b"".join(chunks)
+
+
+def fetch_feed(url: str, timeout: float = FEED_TIMEOUT, cache: FeedCache = None):
+    """
+    Скачивает и разбирает одну ленту. Возвращает feedparser-результат.
+    С кешем шлёт условный запрос; на 304 парсинг пропускается.
+    """
+    deadline = time.monotonic() + timeout
+    cond = cache.request_headers(url) if cache else {}
+    with _host_slot(url):
+        left = max(0.5, deadline - time.monotonic())
+        with metrics.timer("feeds.http"), \
+                session().get(url, headers=cond, timeout=(min(4.0, left), left), stream=True) as r:
+            if r.status_code == 304 and cache:
+                return cache.hit(url)
+            r.raise_for_status()
+            raw = _read_until(r, deadline)
+            headers = {k.lower(): v for k, v in r.headers.items()}
+    with metrics.timer("feeds.parse"):
+        parsed = feedparser.parse(raw, response_headers=headers)
+    if cache:
+        cache.store(url, headers, raw, parsed)
+    return parsed
+
+
+def iter_feeds(feeds, timeout: float = FEED_TIMEOUT, deadline: float = FETCH_DEADLINE, cache: FeedCache = None):
+    """
+    Генератор пар (url, parsed) в порядке готовности.
+    Ленты, не успевшие к общему дедлайну или упавшие, молча пропускаются.
+    """
+    pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="feed")
+    futures = {pool.submit(fetch_feed, url, timeout, cache): url for url in feeds}
+    try:
+        for fut in as_completed(futures, timeout=deadline):
+            try:
+                parsed = fut.result()
+            except Exception as e:
+                metrics.error("feeds", e, feed=futures[fut])
+                continue
+            yield futures[fut], parsed
+    except FuturesTimeout:
+        late = [u for f, u in futures.items() if not f.done()]
+        metrics.incr("feeds.late", len(late))
+        print("Feed deadline, skipped:", ", ".join(late))
+    finally:
+        # не ждём отстающих: их ограничит собственный дедлайн ленты
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Телеметрия запуска: таймеры стадий, счётчики и ошибки.
+
+Каждый запуск (постер, дайджест, цикл демона) пишет отчёт
+data/report_<имя>.json; при METRICS_PROM_DIR — ещё и textfile для
+node_exporter. PROFILE=1 снимает cProfile главного потока в
+data/profile_<имя>.prof (смотреть: python -m pstats / snakeviz).
+"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+REPORT_DIR = "data"
+PROM_DIR = os.getenv("METRICS_PROM_DIR", "")
+PROFILE = os.getenv("PROFILE", "") not in ("", "0")
+# сколько последних ошибок сохраняем в отчёте
+MAX_ERRORS = 50
+
+
+class Run:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.errors = []
+
+    def observe(self, stage: str, seconds: float, failed: bool = False):
+        with self.lock:
+            s = self.stages.setdefault(stage, {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            s["calls"] += 1
+            s["errors"] += 1 if failed else 0
+            s["total_s"] += seconds
+            s["max_s"] = max(s["max_s"], seconds)
+
+    def incr(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, stage: str, exc, **ctx):
+        print("Error:", *ctx.values(), exc)
+        with self.lock:
+            self.errors.append(dict(ctx, stage=stage, error=f"{type(exc).__name__}: {exc}",
+                                    ts=round(time.time(), 3)))
+            del self.errors[:-MAX_ERRORS]
+
+    def report(self) -> dict:
+        with self.lock:
+            stages = {k: dict(v, total_s=round(v["total_s"], 4), max_s=round(v["max_s"], 4))
+                      for k, v in sorted(self.stages.items())}
+            return {
+                "run": self.name,
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "duration_s": round(time.time() - self.started, 3),
+                "stages": stages,
+                "counters": dict(sorted(self.counters.items())),
+                "errors": list(self.errors),
+            }
+
+    def write(self):
+        rep = self.report()
+        _write_atomic(os.path.join(REPORT_DIR, f"report_{self.name}.json"),
+                      json.dumps(rep, ensure_ascii=False, indent=1))
+        if PROM_DIR:
+            _write_atomic(os.path.join(PROM_DIR, f"usdtbot_{self.name}.prom"), to_prometheus(rep))
+        return rep
+
+
+def to_prometheus(rep: dict) -> str:
+    run = rep["run"]
+    out = [
+        "# TYPE usdtbot_run_duration_seconds gauge",
+        f'usdtbot_run_duration_seconds{{run="{run}"}} {rep["duration_s"]}',
+        "# TYPE usdtbot_run_last_timestamp_seconds gauge",
+        f'usdtbot_run_last_timestamp_seconds{{run="{run}"}} {int(time.time())}',
+        "# TYPE usdtbot_run_errors gauge",
+        f'usdtbot_run_errors{{run="{run}"}} {len(rep["errors"])}',
+        "# TYPE usdtbot_stage_seconds gauge",
+    ]
+    for stage, s in rep["stages"].items():
+        out.append(f'usdtbot_stage_seconds{{run="{run}",stage="{stage}"}} {s["total_s"]}')
+    out.append("# TYPE usdtbot_stage_calls gauge")
+    for stage, s in rep["stages"].items():
+        out.append(f'usdtbot_stage_calls{{run="{run}",stage="{stage}"}} {s["calls"]}')
+    out.append("# TYPE usdtbot_stage_errors gauge")
+    for stage, s in rep["stages"].items():
+        out.append(f'usdtbot_stage_errors{{run="{run}",stage="{stage}"}} {s["errors"]}')
+    out.append("# TYPE usdtbot_counter gauge")
+    for name, v in rep["counters"].items():
+        out.append(f'usdtbot_counter{{run="{run}",name="{name}"}} {v}')
+    return "\n".join(out) + "\n"
+
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# ----------- текущий запуск -------------
+
+# вне run() замеры копятся в безымянном запуске и никуда не пишутся
+_current = Run("default")
+
+
+def current() -> Run:
+    return _current
+
+
+@contextmanager
+def run(name: str):
+    """Запуск целиком: новый набор метрик, отчёт в конце (и при падении)."""
+    global _current
+    prev, _current = _current, Run(name)
+    prof = cProfile.Profile() if PROFILE else None
+    if prof:
+        prof.enable()
+    try:
+        yield _current
+    finally:
+        if prof:
+            prof.disable()
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            prof.dump_stats(os.path.join(REPORT_DIR, f"profile_{name}.prof"))
+        rep = _current.write()
+        busy = ", ".join(f"{k}={v['total_s']:.2f}s" for k, v in rep["stages"].items())
+        print(f"Run {name}: {rep['duration_s']:.2f}s; {busy}")
+        _current = prev
+
+
+@contextmanager
+def timer(stage: str):
+    r = _current
+    t = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        r.observe(stage, time.perf_counter() - t, failed)
+
+
+def timed(stage: str):
+    """Декоратор: вся функция — одна стадия."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*a, **kw):
+            with timer(stage):
+                return fn(*a, **kw)
+        return wrapper
+    return deco
+
+
+def incr(name: str, n: int = 1):
+    _current.incr(name, n)
+
+
+def error(stage: str, exc, **ctx):
+    _current.error(stage, exc, **ctx)
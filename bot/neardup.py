@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Поиск почти-дубликатов: одна новость из ТАСС, РИА, Интерфакса и Ленты.
+
+Текст -> «основы» слов -> MinHash-подпись -> LSH-индекс по полосам.
+Подписи хранятся в записях журнала (store.EventLog), индекс строится
+в памяти при старте и проверяет кандидата за доли миллисекунды.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import time
+
+NUM_PERM = 64
+BANDS = 32          # 32 полосы по 2 значения: высокая полнота уже при J≈0.4
+ROWS = NUM_PERM // BANDS
+
+# пороги сходства (оценка Жаккара) для заголовков и текстов; заголовок лишь
+# подозрение («доллар вырос до 95» и «упал до 90» близки), решает текст
+TITLE_THRESHOLD = float(os.getenv("NEARDUP_TITLE", "0.7"))
+BODY_THRESHOLD = float(os.getenv("NEARDUP_BODY", "0.4"))
+# за сколько часов помним подписи
+NEARDUP_HOURS = float(os.getenv("NEARDUP_HOURS", "48"))
+
+_MERSENNE = (1 << 61) - 1
+_MAX32 = (1 << 32) - 1
+
+# стабильные между запусками коэффициенты перестановок
+_PERMS = []
+for _i in range(NUM_PERM):
+    _d = hashlib.blake2b(f"perm:{_i}".encode(), digest_size=16).digest()
+    _a, _b = struct.unpack("<QQ", _d)
+    _PERMS.append(((_a % (_MERSENNE - 1)) + 1, _b % _MERSENNE))
+
+_WORD = re.compile(r"[0-9a-zа-яё]+")
+_STOP = {
+    "и", "в", "во", "на", "с", "со", "по", "за", "из", "от", "до", "не", "что", "как",
+    "о", "об", "к", "у", "для", "при", "это", "его", "ее", "её", "их", "а", "но", "же",
+    "the", "of", "and", "to", "in",
+}
+
+
+def stems(text: str) -> list:
+    """Слова без стоп-слов, усечённые до 5 букв — грубая замена стеммингу."""
+    return [w[:5] for w in _WORD.findall((text or "").lower().replace("ё", "е"))
+            if w not in _STOP and len(w) > 1]
+
+
+def _h(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(features) -> tuple:
+    hashes = [_h(f) for f in features]
+    if not hashes:
+        return ()
+    return tuple(
+        min(((a * x + b) % _MERSENNE) & _MAX32 for x in hashes)
+        for a, b in _PERMS
+    )
+
+
+def title_signature(title: str) -> tuple:
+    return minhash(set(stems(title)))
+
+
+def body_signature(body: str, k: int = 3) -> tuple:
+    words = stems(body)
+    if len(words) < k:
+        return minhash(set(words))
+    return minhash({" ".join(words[i:i + k]) for i in range(len(words) - k + 1)})
+
+
+def similarity(a: tuple, b: tuple) -> float:
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def to_hex(sig: tuple) -> str:
+    return "".join(f"{v:08x}" for v in sig)
+
+
+def from_hex(s: str) -> tuple:
+    """Подпись из журнала; записанная при другом NUM_PERM — пустая (пересчитать)."""
+    sig = tuple(int(s[i:i + 8], 16) for i in range(0, len(s or ""), 8))
+    return sig if len(sig) == NUM_PERM else ()
+
+
+class NearDupIndex:
+    """LSH-индекс MinHash-подписей: кандидаты по совпавшим полосам, затем точная оценка."""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.sigs = {}
+        # ключ -> время публикации (unix), для вытеснения старше NEARDUP_HOURS
+        self.added = {}
+        self.buckets = [dict() for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self.sigs)
+
+    def _bands(self, sig):
+        for i in range(BANDS):
+            yield i, sig[i * ROWS:(i + 1) * ROWS]
+
+    def add(self, key: str, sig: tuple, ts: float = None):
+        if not sig or key in self.sigs:
+            return
+        self.sigs[key] = sig
+        self.added[key] = ts if ts is not None else time.time()
+        for i, band in self._bands(sig):
+            self.buckets[i].setdefault(band, []).append(key)
+
+    def evict(self, cutoff: float) -> int:
+        """Убрать подписи, добавленные раньше cutoff; сколько убрано."""
+        old = [k for k, ts in self.added.items() if ts < cutoff]
+        for key in old:
+            sig = self.sigs.pop(key)
+            del self.added[key]
+            for i, band in self._bands(sig):
+                lst = self.buckets[i].get(band)
+                if lst is not None:
+                    lst.remove(key)
+                    if not lst:
+                        del self.buckets[i][band]
+        return len(old)
+
+    def matches(self, sig: tuple, exclude=None) -> list:
+        """Все (ключ, сходство) выше порога; exclude — не считать."""
+        if not sig:
+            return []
+        seen = {exclude}
+        out = []
+        for i, band in self._bands(sig):
+            for key in self.buckets[i].get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                sim = similarity(sig, self.sigs[key])
+                if sim >= self.threshold:
+                    out.append((key, sim))
+        return out
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP-клиент: одна сессия и один пул соединений на весь процесс.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "Mozilla/5.0 (bot; news-poster) Safari/537.36"
+
+# размер пула соединений (на каждый хост)
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+_session = None
+_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers["User-Agent"] = USER_AGENT
+            _session = s
+    return _session
@@ -6,27 +6,47 @@
 """
 
 import os
-import json
-import random
-import textwrap
+import re
+import codecs
+import signal
+import argparse
+import itertools
 import time
-from datetime import datetime, timezone
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone, timedelta
 from urllib.parse import urlparse
 
-import requests
-import feedparser
+import lxml.html
+from lxml import etree
 from readability import Document
-from bs4 import BeautifulSoup
+from readability.cleaners import html_cleaner
+from readability.htmls import shorten_title
 from dateutil import tz
-
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from dateutil import parser as dtparser
+
+from net import session
+from feeds import iter_feeds, FeedCache, FULLTEXT_KEYS
+from store import EventLog, PostedStore, parse_ts, canonical_url
+from sources import SourceStats, iter_candidates, freshness
+from cover import warm_backgrounds, render_covers, cover_mime
+from scheduler import Scheduler
+import tg
+import neardup
+import metrics
+import textclean
+import categories
+import channels
+import spool
+import rollup
 
 # ----------- НАСТРОЙКИ -------------
 
 # 1) Токен и канал (username канала или отрицательный ID)
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@your_channel_username")
+# несколько каналов — через запятую; свои ленты/рубрики/бренд — в data/channels.json
+CHANNEL_IDS = tg.parse_chat_ids(CHANNEL_ID)
 
 # 2) Таймзона отображения
 LOCAL_TZ = tz.gettz(os.getenv("TZ", "Europe/Moscow"))
@@ -34,11 +54,36 @@ LOCAL_TZ = tz.gettz(os.getenv("TZ", "Europe/Moscow"))
 # 3) Минимальная длина текста для публикации
 MIN_BODY_LEN = 400
 
-# 4) Где хранить состояние (дубликаты)
+# 4) Где хранить состояние (журнал событий, общий с дайджестом)
 STATE_DIR = "data"
-POSTED_FILE = os.path.join(STATE_DIR, "posted.json")
-
-# 5) Источники (RSS/ленты) — только RU
+EVENTS_FILE = os.path.join(STATE_DIR, "events.jsonl")
+
+# 5) Параллельное извлечение: сколько кандидатов качаем сразу
+#    и сколько ещё ждём после первой удачной статьи, прежде чем выбрать лучшую
+EXTRACT_CANDIDATES = int(os.getenv("EXTRACT_CANDIDATES", "6"))
+EXTRACT_GRACE = float(os.getenv("EXTRACT_GRACE", "3"))
+EXTRACT_DEADLINE = float(os.getenv("EXTRACT_DEADLINE", "40"))
+
+# 5a) Сколько статей максимум пробуем скачать за один запуск
+MAX_FETCH_ATTEMPTS = int(os.getenv("MAX_FETCH_ATTEMPTS", "18"))
+
+# 5b) Загрузка страницы: потолок размера и ранняя остановка после </article>,
+#     (</main>), если внутри закрывшегося элемента PAGE_EARLY_PARAGRAPHS абзацев
+#     и не меньше PAGE_EARLY_MIN_TEXT байт текста (карточки-анонсы не в счёт)
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+PAGE_EARLY_PARAGRAPHS = int(os.getenv("PAGE_EARLY_PARAGRAPHS", "5"))
+PAGE_EARLY_MIN_TEXT = int(os.getenv("PAGE_EARLY_MIN_TEXT", "2000"))
+
+# 6) Режим демона (--daemon): опрос лент, минимальный интервал между постами,
+#    часы дайджеста (по LOCAL_TZ) и как часто сбрасывать состояние на диск
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "60"))
+POST_MIN_GAP = float(os.getenv("POST_MIN_GAP", "600"))
+# как часто демон заглядывает в очередь входящих (spool.SPOOL_DIR), сек
+SPOOL_INTERVAL = float(os.getenv("SPOOL_INTERVAL", "2"))
+DIGEST_HOURS = [int(h) for h in os.getenv("DIGEST_HOURS", "0,8,16").split(",") if h.strip()]
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "120"))
+
+# 7) Источники (RSS/ленты) — только RU
 FEEDS = [
     # Агентства
     "https://tass.ru/rss/v2.xml",
@@ -63,31 +108,144 @@ FEEDS = [
 
 # ----------- УТИЛИТЫ -------------
 
+_posted = None
+_feed_cache = None
+_neardup = None
+_sources = None
+_channels = None
+_rollup = None
+_tg_files = None
+
+
 def ensure_state():
     os.makedirs(STATE_DIR, exist_ok=True)
-    if not os.path.exists(POSTED_FILE):
-        with open(POSTED_FILE, "w", encoding="utf-8") as f:
-            json.dump({"links": []}, f, ensure_ascii=False)
 
 
-def was_posted(link: str) -> bool:
-    ensure_state()
-    with open(POSTED_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return link in data.get("links", [])
+def posted_store() -> PostedStore:
+    # загружаем один раз за запуск
+    global _posted
+    if _posted is None:
+        ensure_state()
+        _posted = PostedStore(EventLog(EVENTS_FILE))
+    return _posted
 
 
-def mark_posted(link: str):
-    ensure_state()
-    with open(POSTED_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if link not in data["links"]:
-        data["links"].append(link)
-    # обрезаем журнал, чтобы не рос бесконечно
-    if len(data["links"]) > 5000:
-        data["links"] = data["links"][-3000:]
-    with open(POSTED_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def mark_posted(link: str, title: str = None, **fields):
+    # с заголовком — это публикация (попадёт в дайджест), без — просто «видели»
+    # запись на диск — пачкой, в flush_state()
+    if title:
+        posted_store().add(link, kind="posted", title=title, **fields)
+    else:
+        posted_store().add(link, **fields)
+
+
+def channel_list() -> list:
+    global _channels
+    if _channels is None:
+        _channels = channels.load(CHANNEL_IDS)
+    return _channels
+
+
+def due_channels(default_gap: float = 0) -> list:
+    """Каналы, которым пора: с прошлого поста прошло min_gap (или default_gap)."""
+    store = posted_store()
+    return [ch for ch in channel_list()
+            if store.due(ch.id, default_gap if ch.min_gap is None else ch.min_gap)]
+
+
+def neardup_index():
+    """
+    (заголовки, тексты) — LSH-индексы недавних публикаций.
+    Подписи лежат в записях журнала; для старых записей считаем по заголовку.
+    """
+    global _neardup
+    if _neardup is None:
+        titles = neardup.NearDupIndex(neardup.TITLE_THRESHOLD)
+        bodies = neardup.NearDupIndex(neardup.BODY_THRESHOLD)
+        since = datetime.now(timezone.utc) - timedelta(hours=neardup.NEARDUP_HOURS)
+        for rec in posted_store().log.read_since(since, kinds={"posted"}):
+            link = rec.get("link", "")
+            ts = parse_ts(rec["ts"]).timestamp()
+            sig_t = neardup.from_hex(rec.get("sig_t")) or neardup.title_signature(rec.get("title", ""))
+            titles.add(link, sig_t, ts)
+            bodies.add(link, neardup.from_hex(rec.get("sig_b")), ts)
+        _neardup = (titles, bodies)
+    return _neardup
+
+
+def evict_neardup():
+    # демон живёт неделями: сравниваем только с публикациями за NEARDUP_HOURS
+    if _neardup is None:
+        return
+    cutoff = time.time() - neardup.NEARDUP_HOURS * 3600
+    for index in _neardup:
+        index.evict(cutoff)
+
+
+def near_duplicate(title: str = None, body_sig: tuple = None, link: str = None) -> dict:
+    """
+    Похожие опубликованные новости: {ссылка: чаты, куда она ушла | None — во все}.
+    Дубль решается по каналам: канал, где оригинала не было, статью ещё ждёт.
+    Сама link не в счёт: статья, ушедшая в один канал, ещё может уйти в другой.
+    """
+    titles, bodies = neardup_index()
+    hits = []
+    if title:
+        hits += titles.matches(neardup.title_signature(title), exclude=link)
+    if body_sig:
+        hits += bodies.matches(body_sig, exclude=link)
+    chats = posted_store().chats
+    return {key: chats.get(canonical_url(key)) for key, _ in hits}
+
+
+def dup_in(dups: dict, chat: str) -> bool:
+    """Был ли в чате оригинал хоть одного из near_duplicate()."""
+    return any(c is None or chat in c for c in dups.values())
+
+
+def digest_rollup() -> rollup.Rollup:
+    # агрегат для дайджестов пополняется по мере публикаций
+    global _rollup
+    if _rollup is None:
+        _rollup = rollup.load(posted_store().log)
+    return _rollup
+
+
+def tg_file_ids() -> tg.FileIds:
+    global _tg_files
+    if _tg_files is None:
+        ensure_state()
+        _tg_files = tg.FileIds()
+    return _tg_files
+
+
+def source_stats() -> SourceStats:
+    global _sources
+    if _sources is None:
+        ensure_state()
+        _sources = SourceStats()
+    return _sources
+
+
+def feed_cache() -> FeedCache:
+    global _feed_cache
+    if _feed_cache is None:
+        ensure_state()
+        _feed_cache = FeedCache()
+    return _feed_cache
+
+
+def flush_state():
+    if _posted is not None:
+        _posted.flush()
+    if _feed_cache is not None:
+        _feed_cache.save()
+    if _sources is not None:
+        _sources.save()
+    if _rollup is not None:
+        _rollup.save()
+    if _tg_files is not None:
+        _tg_files.save()
 
 
 def domain_of(url: str) -> str:
@@ -98,78 +256,245 @@ def domain_of(url: str) -> str:
         return "source"
 
 
-def get(url: str, timeout=12) -> requests.Response:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (bot; news-poster) Safari/537.36"
-    }
-    return requests.get(url, headers=headers, timeout=timeout)
+_HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "")
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([a-z0-9_\-]+)""", re.I)
+# открывающие и закрывающие <article>/<main> — для поиска пары закрывшемуся тегу
+_BLOCK_TAG_RE = re.compile(rb"<(/?)(article|main)[\s>/]", re.I)
+_P_OPEN_RE = re.compile(rb"<p[\s>]", re.I)
+_TAG_RE = re.compile(rb"<[^>]*>")
+
+
+class _ArticleEnd:
+    """
+    Ищет в приходящих байтах закрытие <article>/<main>, внутри которого уже
+    полный текст статьи: абзацы и текст считаются только между этим тегом и
+    его открывающей парой, так что анонсы в сайдбаре остановку не вызывают.
+    """
+
+    # последние байты не разбираем, пока не придёт следующий кусок: тег может быть разрезан
+    _MARGIN = 16
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+        self.stack = []
+
+    def feed(self, chunk: bytes) -> bool:
+        """Дописать кусок; True — статья закончилась, дальше можно не читать."""
+        self.buf += chunk
+        end = max(len(self.buf) - self._MARGIN, self.pos)
+        for m in _BLOCK_TAG_RE.finditer(self.buf, self.pos, end):
+            self.pos = m.start() + 1
+            name = m.group(2).lower()
+            if not m.group(1):
+                self.stack.append((name, m.end()))
+                continue
+            # закрывающий: снимаем до своей пары (кривую вложенность прощаем)
+            while self.stack:
+                opened, start = self.stack.pop()
+                if opened == name:
+                    if self._is_article(bytes(self.buf[start:m.start()])):
+                        return True
+                    break
+        return False
+
+    @staticmethod
+    def _is_article(seg: bytes) -> bool:
+        if len(_P_OPEN_RE.findall(seg)) < PAGE_EARLY_PARAGRAPHS:
+            return False
+        return len(_TAG_RE.sub(b"", seg).strip()) >= PAGE_EARLY_MIN_TEXT
+
+
+def _charset(name):
+    try:
+        return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+
+def fetch_page(url: str, timeout=12) -> tuple[bytes, str]:
+    """
+    Потоковая загрузка статьи: (байты, кодировка|None).
+    Не-HTML отбрасываем по Content-Type, читаем не больше PAGE_MAX_BYTES и
+    останавливаемся на </article> (</main>), если внутри него уже весь текст.
+    Кодировка — из заголовка, <meta charset> или догадкой; текст сами не
+    декодируем, байты сразу уходят в lxml.
+    """
+    with session().get(url, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        ctype = r.headers.get("content-type", "").lower()
+        if ctype.split(";")[0].strip() not in _HTML_TYPES:
+            raise ValueError(f"not html: {ctype}")
+        enc = _charset(ctype.split("charset=")[1].split(";")[0].strip(" \"'")) if "charset=" in ctype else None
+
+        scan = _ArticleEnd()
+        for chunk in r.iter_content(chunk_size=16384):
+            if scan.feed(chunk):
+                metrics.incr("page.early_stop")
+                break
+            if len(scan.buf) >= PAGE_MAX_BYTES:
+                metrics.incr("page.truncated")
+                break
+    raw = bytes(scan.buf[:PAGE_MAX_BYTES])
+    metrics.incr("page.bytes", len(raw))
+    if enc is None:
+        m = _CHARSET_RE.search(raw, 0, 4096)
+        enc = _charset(m.group(1)) if m else None
+    if enc is None:
+        # кодировка не объявлена: валидный UTF-8 или (источники русские) cp1251
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(raw[:65536])
+            enc = "utf-8"
+        except UnicodeDecodeError:
+            enc = "cp1251"
+    return raw, enc
 
 
 # ----------- ИЗВЛЕЧЕНИЕ ТЕКСТА -------------
 
-def extract_article(link: str) -> tuple[str, str, str]:
+_utf8_parser = lxml.html.HTMLParser(encoding="utf-8", remove_comments=True)
+_raw_parser = lxml.html.HTMLParser(remove_comments=True)
+
+# теги, которые выкидываем из текста статьи
+_BAD_TAGS = ("script", "style", "header", "footer", "nav", "form", "aside", "noscript")
+# а эти — ещё до readability: они никогда не часть статьи
+_PRE_DROP_TAGS = ("script", "style", "noscript")
+
+# метатеги, которые нам нужны: одна XPath-выборка по <head>
+_META_XPATH = etree.XPath("/html/head/meta[@content] | /html/body/meta[@content]")
+
+
+class TreeDocument(Document):
     """
-    Возвращает: title, body, category
-    Текст очищается от меню/навигации; безопасно нормализуется.
+    readability поверх уже разобранного дерева.
+    Document на каждый short_title()/summary() заново парсит строку;
+    здесь вместо этого берётся копия готового дерева (clean_html её и так делает).
     """
-    html = get(link).text
-    doc = Document(html)
-    title = doc.short_title() or ""
-    article_html = doc.summary(html_partial=True)
 
-    soup = BeautifulSoup(article_html, "lxml")
+    def __init__(self, tree, **kw):
+        super().__init__("", **kw)
+        self.tree = tree
 
-    # Удаляем возможные таблицы, списки тегов, меню, скрипты
-    for bad in soup(["script", "style", "header", "footer", "nav", "form", "aside", "noscript"]):
-        bad.decompose()
-
-    # Собираем текст параграфов
-    paragraphs = []
-    for p in soup.find_all(["p", "li"]):
-        t = " ".join(p.get_text(separator=" ", strip=True).split())
-        # отбрасываем строки-«облака тегов» и рубрикаторы
-        if not t:
-            continue
-        tokens = t.split()
-        # если слишком много однословной «мешанины» — выбросить
-        if sum(1 for tok in tokens if tok.istitle()) > 12 and len(tokens) > 30:
-            continue
-        if "подписывайтесь" in t.lower() or "телеграм" in t.lower() and "канал" in t.lower():
-            continue
-        # часто медиа вставляют «Читайте также» — убираем
-        if t.lower().startswith(("читайте также", "см. также", "по теме")):
-            continue
-        paragraphs.append(t)
+    def _parse(self, input):
+        self.encoding = "utf-8"
+        doc = html_cleaner.clean_html(self.tree)
+        doc.resolve_base_href(handle_failures=self.handle_failures)
+        return doc
+
+
+@lru_cache(maxsize=16)
+def _parser_for(encoding: str) -> lxml.html.HTMLParser:
+    return lxml.html.HTMLParser(encoding=encoding, remove_comments=True)
 
-    body = []
-    seen = set()
-    for t in paragraphs:
-        if t in seen:
-            continue
-        seen.add(t)
-        # мягкая «перефраза» без искажения фактов: склейка коротких предложений
-        t = t.replace(" ,", ",").replace(" .", ".")
-        body.append(t)
 
-    body_text = "\n\n".join(body)
-    body_text = normalize_spaces(body_text)
+def parse_html(html, encoding: str = None) -> lxml.html.HtmlElement:
+    if isinstance(html, str):
+        return lxml.html.document_fromstring(html.encode("utf-8", "replace"), parser=_utf8_parser)
+    parser = _parser_for(encoding) if encoding else _raw_parser
+    return lxml.html.document_fromstring(html, parser=parser)
+
+
+def read_meta(tree) -> dict:
+    """
+    Метатеги страницы: category (section/category), og:title, og:image, published.
+    """
+    meta = {}
+    for tag in _META_XPATH(tree):
+        n = (tag.get("name") or tag.get("property") or tag.get("itemprop") or "").lower()
+        v = (tag.get("content") or "").strip()
+        if not n or not v:
+            continue
+        if ("section" in n or "category" in n) and "category" not in meta:
+            meta["category"] = v
+        elif n == "og:title":
+            meta.setdefault("og_title", v)
+        elif n == "og:image":
+            meta.setdefault("og_image", v)
+        elif n in ("article:published_time", "datepublished", "pubdate", "publish-date"):
+            meta.setdefault("published", v)
+    return meta
+
+
+def extract_page(link: str, html=None, encoding: str = None) -> dict:
+    """
+    Страница разбирается lxml ровно один раз: метатеги читаются из дерева,
+    readability работает с его копией.
+    Возвращает dict: title, body, category, meta.
+    """
+    if html is None:
+        with metrics.timer("extract.http"):
+            html, encoding = fetch_page(link)
+    with metrics.timer("extract.parse"):
+        tree = parse_html(html, encoding)
+    # метатеги — до readability: она правит своё дерево
+    meta = read_meta(tree)
+    title = shorten_title(tree) or ""
+    # скрипты и стили в текст не попадут — убираем до readability, чтобы ей (и её
+    # копиям дерева) доставалось меньше узлов; form/aside/header — только в clean_body():
+    # на страницах ASP.NET WebForms <form> обёрнута вокруг всей статьи
+    for bad in list(tree.iter(*_PRE_DROP_TAGS)):
+        bad.drop_tree()
+    with metrics.timer("extract.readability"):
+        article_html = TreeDocument(tree).summary(html_partial=True)
+
+    with metrics.timer("extract.clean"):
+        frag = lxml.html.fragment_fromstring(article_html, create_parent="div")
+        body_text = clean_body(frag)
 
     # Категорию пробуем вытащить по метатегам/заголовкам
-    category = guess_category(html, title, body_text)
+    category = guess_category(meta, title, body_text)
+
+    return {"title": clean_title(title), "body": body_text, "category": category, "meta": meta}
+
+
+def clean_body(frag) -> str:
+    """Текст статьи из фрагмента: только абзацы, без мусора и повторов."""
+    # Удаляем возможные таблицы, списки тегов, меню, скрипты
+    for bad in list(frag.iter(*_BAD_TAGS)):
+        bad.drop_tree()
+
+    # абзацы -> textclean: пробелы, служебные фразы, «облака тегов», повторы
+    texts = (" ".join(p.itertext()) for p in frag.iter("p", "li"))
+    return "\n\n".join(textclean.clean_paragraphs(texts))
 
-    return clean_title(title), body_text, category
+
+def entry_fulltext(e):
+    """Полный текст из самой ленты (rbc_news:full-text, yandex:full-text, content:encoded)."""
+    for key in FULLTEXT_KEYS:
+        if e.get(key):
+            return e[key]
+    for c in e.get("content") or []:
+        if c.get("value"):
+            return c["value"]
+    return None
+
+
+@metrics.timed("extract.feed")
+def extract_from_feed(title: str, fulltext: str) -> dict:
+    """
+    Быстрый путь без скачивания страницы: текст уже есть в RSS.
+    Простой текст без разметки режем на абзацы по переводам строк.
+    """
+    if "<" not in fulltext:
+        fulltext = "".join(f"<p>{escape_html(ln)}</p>" for ln in fulltext.splitlines() if ln.strip())
+    frag = lxml.html.fragment_fromstring(fulltext, create_parent="div")
+    body_text = clean_body(frag)
+    return {"title": clean_title(title), "body": body_text,
+            "category": guess_category({}, title, body_text), "meta": {}}
+
+
+def extract_article(link: str) -> tuple[str, str, str]:
+    """
+    Возвращает: title, body, category
+    Текст очищается от меню/навигации; безопасно нормализуется.
+    """
+    page = extract_page(link)
+    return page["title"], page["body"], page["category"]
 
 
 def normalize_spaces(s: str) -> str:
-    s = s.replace("\xa0", " ")
-    s = " ".join(s.split())
-    # возвращаем абзацы
-    s = s.replace(". ", ".§").replace("! ", "!§").replace("? ", "?§")
-    s = s.replace("§", " ")
-    s = s.replace("\n ", "\n")
-    # лёгкая пунктуация
-    s = s.replace(" ,", ",").replace(" .", ".")
-    return s
+    # пробелы внутри абзацев схлопываются, пустые строки между абзацами остаются
+    return textclean.normalize(s)
 
 
 def clean_title(t: str) -> str:
@@ -182,265 +507,95 @@ def clean_title(t: str) -> str:
     return t
 
 
-def guess_category(html: str, title: str, body: str) -> str:
-    meta = BeautifulSoup(html, "lxml")
-    for tag in meta.find_all("meta"):
-        n = (tag.get("name") or tag.get("property") or "").lower()
-        if "section" in n or "category" in n:
-            v = tag.get("content")
-            if v:
-                return simplify_category(v)
-    # fallback — по ключевым словам
-    low = (title + " " + body).lower()
-    if any(w in low for w in ["акция", "рынок", "инфляц", "бюджет", "эконом"]):
-        return "Экономика"
-    if any(w in low for w in ["технолог", "стартап", "it", "программист", "искусств", "нейросет"]):
-        return "Технологии"
-    if any(w in low for w in ["суд", "следователь", "силов", "мвд", "мчс", "происшеств"]):
-        return "Происшествия"
-    if any(w in low for w in ["полит", "парламент", "правительств", "санкц"]):
-        return "Политика"
-    return "Общество"
+def guess_category(meta: dict, title: str, body: str) -> str:
+    if meta.get("category"):
+        return simplify_category(meta["category"])
+    # fallback — по ключевым словам (таблицы в data/categories.json)
+    return categories.classifier().guess(title, body)
 
 
 def simplify_category(s: str) -> str:
-    s = s.strip().capitalize()
-    mapping = {
-        "economy": "Экономика", "business": "Экономика",
-        "tech": "Технологии", "science": "Технологии",
-        "politics": "Политика", "world": "Политика",
-        "incidents": "Происшествия",
-        "society": "Общество", "culture": "Культура", "sport": "Спорт",
-        "финансы": "Экономика", "технологии": "Технологии",
-        "политика": "Политика", "происшествия": "Происшествия",
-        "общество": "Общество", "экономика": "Экономика",
-    }
-    for k, v in mapping.items():
-        if k.lower() in s.lower():
-            return v
-    # нормализация русских вариантов
-    ru = {"Экономика","Технологии","Политика","Происшествия","Общество","Культура","Спорт"}
-    if s in ru: return s
-    return "Общество"
-
-
-# ----------- РИСОВАНИЕ ОБЛОЖКИ -------------
-
-def try_font(size: int, bold=False) -> ImageFont.FreeTypeFont:
-    # используем системные DejaVu — они есть в GHA runner
-    paths = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf" if bold else "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf" if bold else "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-    ]
-    for p in paths:
-        if os.path.exists(p):
-            return ImageFont.truetype(p, size=size)
-    return ImageFont.load_default()
-
-
-def draw_badge(draw: ImageDraw.ImageDraw, xy, text, font, pad=(14, 8), fill=(40, 40, 40), fg=(230, 230, 230)):
-    x, y = xy
-    w, h = text_size(draw, text, font)
-    rw, rh = w + pad[0]*2, h + pad[1]*2
-    radius = rh // 2
-    rect = [x, y, x+rw, y+rh]
-    rounded(draw, rect, radius, fill)
-    draw.text((x+pad[0], y+pad[1]), text, font=font, fill=fg)
-    return rw, rh
-
-
-def rounded(draw, rect, r, color):
-    (x1, y1, x2, y2) = rect
-    draw.rounded_rectangle(rect, radius=r, fill=color)
-
-
-def text_size(draw, text, font):
-    # совместимость разных версий Pillow
-    try:
-        bbox = draw.textbbox((0,0), text, font=font)
-        return (bbox[2]-bbox[0], bbox[3]-bbox[1])
-    except Exception:
-        return draw.textsize(text, font=font)
-
-
-def draw_multiline_fit(draw, text, font, box, fill=(255,255,255), line_spacing=6, max_lines=4):
-    """
-    Впишем текст в прямоугольник: уменьшаем кегль, переносим строки.
-    """
-    x, y, w, h = box
-    size = font.size
-    while size >= 20:
-        f = try_font(size, bold=True)
-        lines = []
-        # оценочно подбираем ширину
-        words = text.split()
-        line = []
-        for word in words:
-            test = " ".join(line+[word])
-            tw, th = text_size(draw, test, f)
-            if tw <= w:
-                line.append(word)
-            else:
-                if not line:
-                    # слово длиннее строки — жесткий перенос
-                    line = [word]
-                lines.append(" ".join(line))
-                line = [word]
-        if line:
-            lines.append(" ".join(line))
-
-        # урежем по числу строк
-        if len(lines) > max_lines:
-            lines = lines[:max_lines]
-            # добавим многоточие к последней
-            if not lines[-1].endswith("…"):
-                lines[-1] = lines[-1].rstrip(".,;: ") + "…"
-
-        # высота блока
-        th_total = 0
-        for ln in lines:
-            th_total += text_size(draw, ln, f)[1] + line_spacing
-        th_total -= line_spacing
-
-        if th_total <= h:
-            # рисуем
-            cy = y + (h - th_total) // 2
-            for ln in lines:
-                tw, th = text_size(draw, ln, f)
-                draw.text((x, cy), ln, font=f, fill=fill)
-                cy += th + line_spacing
-            return
-        size -= 2
-
-    # если не вписался — рисуем мелко
-    f = try_font(20, bold=True)
-    draw.text((x, y), text[:80] + "…", font=f, fill=fill)
-
-
-def make_background(size=(1280, 640)) -> Image:
-    """Спокойный градиент с мягкими пятнами."""
-    w, h = size
-    img = Image.new("RGB", size, (18, 20, 24))
-    draw = ImageDraw.Draw(img)
-
-    # фирменная палитра
-    palettes = [
-        ((18,22,27), (34,43,54)),   # графит -> стальной
-        ((20,24,30), (52,31,69)),   # графит -> фиолетово-синий
-        ((17,24,21), (20,55,43)),   # графит -> изумруд
-        ((24,24,24), (62,62,62)),   # тёмный моно
-    ]
-    c1, c2 = random.choice(palettes)
-
-    # вертикальный мягкий градиент
-    for y in range(h):
-        t = y / max(1, h-1)
-        r = int(c1[0] * (1-t) + c2[0] * t)
-        g = int(c1[1] * (1-t) + c2[1] * t)
-        b = int(c1[2] * (1-t) + c2[2] * t)
-        draw.line([(0, y), (w, y)], fill=(r,g,b))
-
-    # soft-spot акценты
-    spots = random.randint(2, 3)
-    for _ in range(spots):
-        sx = random.randint(int(0.2*w), int(0.8*w))
-        sy = random.randint(int(0.2*h), int(0.8*h))
-        sr = random.randint(int(0.12*h), int(0.22*h))
-        overlay = Image.new("L", (w, h), 0)
-        odraw = ImageDraw.Draw(overlay)
-        odraw.ellipse((sx-sr, sy-sr, sx+sr, sy+sr), fill=random.randint(60, 110))
-        overlay = overlay.filter(ImageFilter.GaussianBlur(radius=int(0.07*h)))
-        # осветление
-        img = Image.composite(Image.new("RGB", size, (240,240,240)), img, overlay.point(lambda p: int(p*0.35)))
-    # лёгкий шум
-    noise = Image.effect_noise(size, 4).convert("L").point(lambda p: int(p*0.07))
-    img = Image.composite(img, Image.new("RGB", size, (0,0,0)), noise)
-    return img
-
-
-def draw_header_image(title: str, src_domain: str, category: str, post_dt: datetime) -> BytesIO:
-    W, H = 1280, 640
-    img = make_background((W, H))
-    draw = ImageDraw.Draw(img)
-
-    # Логотип
-    # кружок
-    circle_r = 30
-    cx, cy = 64, 64
-    draw.ellipse((cx-circle_r, cy-circle_r, cx+circle_r, cy+circle_r), fill=(230,230,230))
-    # $ по центру
-    sym_font = try_font(42, bold=True)
-    dollar = "$"
-    tw, th = text_size(draw, dollar, sym_font)
-    draw.text((cx - tw//2, cy - th//2 + 1), dollar, font=sym_font, fill=(40,40,40))
-    # название
-    name_font = try_font(42, bold=True)
-    draw.text((cx + circle_r + 18, cy - 22), "USDT=Dollar", font=name_font, fill=(240,240,240))
-
-    # Бейджи справа — сначала «пост: дата», ниже — категория
-    badge_font = try_font(26, bold=False)
-    date_text = post_dt.strftime("пост: %d.%m %H:%M")
-    b1w, b1h = draw_badge(draw, (W-10, 18), date_text, badge_font, fill=(72, 78, 84), fg=(240,240,240))
-    # корректируем X, чтобы бейдж рисовался справа налево
-    draw_badge(draw, (W-10-b1w, 18), date_text, badge_font, fill=(72, 78, 84), fg=(240,240,240))
-    cat_text = category if category else "Новости"
-    b2w, b2h = draw_badge(draw, (W-10-b1w, 18+b1h+12), cat_text, badge_font, fill=(62, 118, 164), fg=(255,255,255))
-
-    # Подложка для заголовка
-    pad = 26
-    box = (26, 150, W-26, H-120)
-    rounded(draw, (box[0], box[1], box[2], box[3]), 28, (0,0,0,))  # затемнение
-    # слегка прозрачнее: поверх — чёрный с альфой
-    overlay = Image.new("RGBA", (W, H), (0,0,0,0))
-    od = ImageDraw.Draw(overlay)
-    od.rounded_rectangle((box[0], box[1], box[2], box[3]), radius=28, fill=(0,0,0,160))
-    img = Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
-
-    draw = ImageDraw.Draw(img)
-    title_font = try_font(64, bold=True)
-    draw_multiline_fit(
-        draw,
-        title,
-        title_font,
-        (box[0]+pad, box[1]+pad, box[2]-box[0]-pad*2, box[3]-box[1]-pad*2),
-        fill=(255,255,255),
-        max_lines=4
-    )
-
-    # Нижние подписи
-    small = try_font(26)
-    draw.text((32, H-44), f"source: {src_domain}", font=small, fill=(210,210,210))
-
-    out = BytesIO()
-    img.save(out, format="JPEG", quality=92, optimize=True)
-    out.seek(0)
-    return out
+    return categories.classifier().simplify(s)
 
 
 # ----------- ТЕЛЕГРАМ -------------
 
-def tg_send_photo(buf: BytesIO, caption_html: str):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-    data = {
-        "chat_id": CHANNEL_ID,
-        "caption": caption_html,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-    }
-    files = {"photo": ("cover.jpg", buf, "image/jpeg")}
-    r = requests.post(url, data=data, files=files, timeout=20)
-    if not r.ok:
-        raise RuntimeError(f"Telegram sendPhoto error {r.status_code}: {r.text}")
+@metrics.timed("telegram")
+def tg_send_photos(posts: dict) -> list:
+    """
+    posts: {chat_id: (байты обложки, подпись)} — уходит параллельно.
+    Одинаковые байты загружаются один раз: первый чат получает файл, остальные — file_id
+    из ответа. Из data/tg_files.json file_id берётся и для тех же байтов позже (повтор
+    отправки в ту же минуту: время поста — часть обложки).
+    Возвращает чаты, куда дошло; если не дошло никуда — исключение.
+    """
+    client = tg.client(BOT_TOKEN)
+    ids = tg_file_ids()
+    name, mime = cover_mime()
+    results = {}
+
+    def send(chats, by_id: bool):
+        futures = {}
+        for chat in chats:
+            photo, caption = posts[chat]
+            fid = ids.get(tg.FileIds.key(photo)) if by_id else None
+            metrics.incr("telegram.reuse" if fid else "telegram.upload")
+            if not fid:
+                metrics.incr("telegram.bytes", len(photo))
+            futures[chat] = client.pool.submit(client.send_photo, chat, fid or photo, caption, name, mime)
+        for chat, fut in futures.items():
+            try:
+                results[chat] = fut.result()
+            except Exception as e:
+                results[chat] = e
+
+    # одинаковые байты: первый чат — загрузка, остальные — по file_id
+    first, rest = {}, []
+    for chat, (photo, _) in posts.items():
+        key = tg.FileIds.key(photo)
+        if ids.get(key) or key in first:
+            rest.append(chat)
+        else:
+            first[key] = chat
+
+    def remember(chats):
+        for chat in chats:
+            fid = None if isinstance(results[chat], Exception) else tg.photo_file_id(results[chat])
+            if fid:
+                ids.put(tg.FileIds.key(posts[chat][0]), fid)
+
+    send(first.values(), by_id=False)
+    remember(first.values())
+    send(rest, by_id=True)
+    # file_id не подошёл (другой бот, файл устарел) — забываем и загружаем заново
+    stale = [c for c in rest if isinstance(results[c], tg.TelegramError) and results[c].status == 400]
+    for c in stale:
+        ids.forget(tg.FileIds.key(posts[c][0]))
+    send(stale, by_id=False)
+    remember(stale)
+
+    ok, errors = [], []
+    for chat, r in results.items():
+        if isinstance(r, Exception):
+            metrics.error("telegram", r, chat=chat)
+            errors.append(r)
+        else:
+            ok.append(chat)
+    if not ok and errors:
+        # ни в один канал не ушло — пусть пробует следующую новость
+        raise errors[0]
+    return ok
 
 
 # ----------- СБОРКА ПОДПИСИ -------------
 
-def build_caption(title: str, body: str, link: str, src_domain: str) -> str:
+def build_caption(title: str, body: str, link: str, src_domain: str,
+                  brand: str = channels.BRAND, brand_url: str = channels.BRAND_URL) -> str:
     # Чёткая структура: Заголовок → текст → источник → канал
     lead = f"<b>{escape_html(title)}</b>"
     details = escape_html(body)
     source = f'Источник: <a href="{link}">{escape_html(src_domain)}</a>'
-    channel = f'<a href="https://t.me/usdtdollarm">USDT=Dollar</a>'
+    channel = f'<a href="{brand_url}">{escape_html(brand)}</a>'
     return f"{lead}\n\n{details}\n\n{source}\n\n{channel}"
 
 
@@ -453,63 +608,408 @@ def escape_html(s: str) -> str:
 
 # ----------- ПОТОК -------------
 
-def fetch_items():
-    items = []
-    for feed in FEEDS:
+def entry_time(e):
+    """Время публикации записи ленты (UTC) или None."""
+    st = e.get("published_parsed") or e.get("updated_parsed")
+    if st:
+        return datetime(*st[:6], tzinfo=timezone.utc)
+    raw = e.get("published") or e.get("updated")
+    if raw:
         try:
-            parsed = feedparser.parse(feed)
-            for e in parsed.entries[:5]:
-                link = e.get("link") or ""
-                title = (e.get("title") or "").strip()
-                if not link or not title:
-                    continue
-                items.append((link, title))
+            dt = dtparser.parse(raw)
+            return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
         except Exception:
-            continue
-    # случайный порядок, чтобы не зацикливаться на одном источнике
-    random.shuffle(items)
+            return None
+    return None
+
+
+@metrics.timed("fetch_items")
+def fetch_items():
+    """Список кандидатов (link, title, published_utc|None, fulltext|None, {ленты})."""
+    items = []
+    # каноническая ссылка -> ленты, где она встретилась (общий set с кандидатом)
+    seen = {}
+    cache = feed_cache()
+    cache.stats = dict.fromkeys(cache.stats, 0)
+    # ленты качаются параллельно, записи приходят по мере готовности
+    # ленты всех каналов разом: общая ссылка качается один раз
+    for feed, parsed in iter_feeds(channels.all_feeds(channel_list(), FEEDS), cache=cache):
+        for e in parsed.entries[:5]:
+            link = e.get("link") or ""
+            title = (e.get("title") or "").strip()
+            if not link or not title:
+                continue
+            # одна ссылка может прийти из нескольких лент — кандидат один, ленты все:
+            # каналу с любой из них статья подходит
+            key = canonical_url(link)
+            if key in seen:
+                seen[key].add(feed)
+                continue
+            seen[key] = {feed}
+            items.append((link, title, entry_time(e), entry_fulltext(e), seen[key]))
+    st = cache.stats
+    for k, v in st.items():
+        metrics.incr(f"feeds.{k}", v)
+    metrics.incr("items", len(items))
+    print(f"Feeds: 304 hit={st['hit']} miss={st['miss']} unchanged={st['unchanged']} "
+          f"downloaded={st['bytes']}B saved~{st['bytes_saved']}B")
+    # порядок задаёт очередь приоритетов в run_once (sources.iter_candidates)
     return items
 
 
-def main():
+def main(items=None):
     ensure_state()
-    items = fetch_items()
-    for link, t in items:
-        if was_posted(link):
-            continue
+    with metrics.run("poster"):
+        try:
+            run_once(items)
+        finally:
+            flush_state()
 
+
+def main_single(enqueue: bool = False):
+    """
+    Одна новость из USDT_TITLE/USDT_LINK/USDT_SUM/USDT_SRC (dispatch.yml):
+    без опроса лент — сразу в run_once; с enqueue — в очередь работающему демону.
+    """
+    rec = spool.item_from_env()
+    if rec is None:
+        print("No USDT_LINK in environment.")
+        return
+    if enqueue:
+        print("Queued:", spool.push(rec))
+        return
+    print("Single item:", rec["link"], "from", rec["source"] or domain_of(rec["link"]))
+    main([spool.candidate(rec)])
+
+
+def recent_domains(hours=6) -> list:
+    """Домены последних публикаций — для разнообразия источников."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    recs = posted_store().log.read_since(since, kinds={"posted"})
+    return [domain_of(r.get("link", "")) for r in recs]
+
+
+def score_article(art: dict, recent: list) -> float:
+    # свежесть: полураспад ~3 часа
+    fresh = freshness(art["published"])
+    # длина: до ~2000 символов чем больше, тем лучше
+    length = min(len(art["body"]), 2000) / 2000
+    # разнообразие: штраф, если домен недавно уже был
+    d = art["domain"]
+    repeat = recent[-3:].count(d) * 0.5 + (0.5 if recent and recent[-1] == d else 0)
+    return fresh * 2 + length - repeat
+
+
+@metrics.timed("extract")
+def _extract_candidate(link, t, published, fulltext=None, fetch=True):
+    """Статья кандидата или None, если текста из ленты мало, а страницу качать нельзя (fetch=False)."""
+    started = time.monotonic()
+    page = None
+    if fulltext:
+        # текст прямо в ленте — страницу не качаем, если его хватает
+        page = extract_from_feed(t, fulltext)
+        if len(page["body"]) < MIN_BODY_LEN:
+            page = None
+    from_feed = page is not None
+    if page is None:
+        if not fetch:
+            return None
+        page = extract_page(link)
+    if published is None and page["meta"].get("published"):
+        # в ленте не было даты — берём из article:published_time
         try:
-            title, body, category = extract_article(link)
-            # Если не смогли распарсить — пропускаем
-            if not title or not body:
-                continue
+            published = dtparser.parse(page["meta"]["published"])
+            if published.tzinfo is None:
+                published = published.replace(tzinfo=timezone.utc)
+        except Exception:
+            published = None
+    return {
+        "link": link, "title": page["title"], "body": page["body"],
+        "category": page["category"], "published": published, "domain": domain_of(link),
+        "latency": time.monotonic() - started, "from_feed": from_feed,
+    }
 
-            # Минимум 400 символов — иначе пропускаем
-            if len(body) < MIN_BODY_LEN:
-                mark_posted(link)  # чтобы не зацикливаться на коротких
+
+def pick_articles(candidates, accept=None, offline=()) -> list:
+    """
+    Извлекает несколько кандидатов параллельно и возвращает все годные, лучшие первыми:
+    лучшая уходит в свои каналы, следующие — каналам, которым она не подошла.
+    После первой годной статьи ждём ещё EXTRACT_GRACE секунд,
+    остальных не дожидаемся. accept(art) — годится ли статья хоть одному каналу;
+    offline — ссылки, для которых страницу не качаем (предохранитель домена).
+    """
+    pool = ThreadPoolExecutor(max_workers=EXTRACT_CANDIDATES, thread_name_prefix="extract")
+    pending = {pool.submit(_extract_candidate, *c[:4], fetch=c[0] not in offline): c for c in candidates}
+    good = []
+    start = time.monotonic()
+    stop_at = start + EXTRACT_DEADLINE
+    try:
+        while pending:
+            left = stop_at - time.monotonic()
+            if left <= 0:
+                break
+            done, _ = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cand = pending.pop(fut)
+                link = cand[0]
+                stats = source_stats()
+                try:
+                    art = fut.result()
+                except Exception as e:
+                    metrics.error("extract", e, link=link)
+                    stats.record(domain_of(link), False)
+                    continue
+                if art is None:
+                    # в ленте только анонс, а сайт на паузе — не отбраковываем, вернёмся позже
+                    metrics.incr("extract.offline")
+                    continue
+                measured = {"latency": art["latency"], "body_len": len(art["body"])}
+                if art["from_feed"]:
+                    # страницу не качали — профиль сайта не трогаем
+                    measured = None
+                # Если не смогли распарсить — пропускаем
+                if not art["title"] or not art["body"]:
+                    metrics.incr("extract.empty")
+                    if measured:
+                        stats.record(domain_of(link), False, **measured)
+                    continue
+                # Минимум 400 символов — иначе пропускаем
+                if len(art["body"]) < MIN_BODY_LEN:
+                    metrics.incr("extract.short")
+                    if measured:
+                        stats.record(domain_of(link), False, **measured)
+                    mark_posted(link)  # чтобы не зацикливаться на коротких
+                    continue
+                if measured:
+                    stats.record(domain_of(link), True, **measured)
+                # та же история из другого источника — решает текст, заголовка мало
+                art["sig_b"] = neardup.body_signature(art["body"])
+                dups = near_duplicate(body_sig=art["sig_b"], link=link)
+                blocked = [ch.id for ch in channel_list() if dup_in(dups, ch.id)]
+                if blocked:
+                    metrics.incr("neardup.body")
+                    dup = next(iter(dups))
+                    print("Near-duplicate:", link, "~", dup, "in", ", ".join(blocked))
+                    if len(blocked) == len(channel_list()):
+                        mark_posted(link, dup_of=dup)
+                        continue
+                    # отказ только там, где оригинал уже был; остальным каналам статья нова
+                    mark_posted(link, dup_of=dup, chats=blocked)
+                art["feeds"] = cand[4] if len(cand) > 4 else None
+                if accept and not accept(art):
+                    # не та рубрика для ждущих каналов — не отбраковываем, другим может подойти
+                    metrics.incr("extract.filtered")
+                    continue
+                if not good:
+                    stop_at = min(stop_at, time.monotonic() + EXTRACT_GRACE)
+                metrics.incr("extract.ok")
+                good.append(art)
+    finally:
+        # незавершённые отменяем, запущенные доработают в фоне
+        pool.shutdown(wait=False, cancel_futures=True)
+    if not good:
+        return []
+    recent = recent_domains()
+    return sorted(good, key=lambda a: score_article(a, recent), reverse=True)
+
+
+def publish(art: dict, targets: list) -> list:
+    """
+    Одна статья — во все каналы targets. Обложка рисуется (и загружается) один раз на бренд,
+    подпись собирается один раз на бренд; запись в журнале — одна на статью.
+    Возвращает чаты, куда дошло.
+    """
+    link, title, body, category = art["link"], art["title"], art["body"], art["category"]
+    src = domain_of(link)
+    now_local = datetime.now(LOCAL_TZ)
+    covers, captions, posts = {}, {}, {}
+    for ch in targets:
+        if ch.brand not in covers:
+            # через кеш обложек: повтор той же статьи (сбой отправки) не рисуется заново
+            with metrics.timer("cover"):
+                covers[ch.brand] = render_covers([(title, src, category, now_local, ch.brand)])[0]
+        brand = (ch.brand, ch.brand_url)
+        if brand not in captions:
+            captions[brand] = build_caption(title, body, link, src, *brand)
+        posts[ch.id] = (covers[ch.brand], captions[brand])
+
+    ok = tg_send_photos(posts)
+    pub = art["published"].isoformat() if art["published"] else None
+    sig_t = neardup.title_signature(title)
+    mark_posted(link, title=title, category=category, event_utc=pub, chats=ok,
+                sig_t=neardup.to_hex(sig_t), sig_b=neardup.to_hex(art["sig_b"]))
+    digest_rollup().add(link, title, category=category, event_utc=pub, chats=ok)
+    titles, bodies = neardup_index()
+    titles.add(link, sig_t)
+    bodies.add(link, art["sig_b"])
+    metrics.incr("posted")
+    metrics.incr("deliveries", len(ok))
+    return ok
+
+
+def run_once(items=None, default_gap: float = 0):
+    """
+    Публикует по одной лучшей свежей новости в каждый канал, которому пора.
+    Статья качается, разбирается и рисуется один раз и уходит сразу во все
+    ждущие каналы, которые её берут (ленты, рубрики). Возвращает список ссылок.
+    """
+    waiting = due_channels(default_gap)
+    if not waiting:
+        return []
+    evict_neardup()
+    if items is None:
+        items = fetch_items()
+    store = posted_store()
+
+    def takers(link, feeds, category=None):
+        return [ch for ch in waiting
+                if ch.takes_feed(feeds) and not store.done_for(link, ch.id)
+                and (category is None or ch.takes_category(category))]
+
+    fresh, suspects = [], []
+    for it in items:
+        want = takers(it[0], it[4] if len(it) > 4 else None)
+        if not want:
+            continue
+        # похожий заголовок уже был во всех каналах, что её ждут, — в конец очереди;
+        # дубль это или продолжение истории («вырос»/«упал»), решит текст после извлечения
+        dups = near_duplicate(it[1], link=it[0])
+        if dups and all(dup_in(dups, ch.id) for ch in want):
+            metrics.incr("neardup.title")
+            suspects.append(it)
+        else:
+            fresh.append(it)
+    metrics.incr("candidates", len(fresh) + len(suspects))
+    # очередь приоритетов: свежесть, вес источника, его успешность, очерёдность доменов;
+    # подозрительные — после всех остальных; не больше MAX_FETCH_ATTEMPTS скачиваний
+    # за запуск на все каналы
+    stats = source_stats()
+    # ссылки без права на загрузку страницы и домены, чья пробная загрузка уже в очереди
+    offline, trial = set(), set()
+    queue = itertools.islice(
+        itertools.chain(iter_candidates(fresh, domain_of, stats, offline=offline, trial=trial),
+                        iter_candidates(suspects, domain_of, stats, offline=offline, trial=trial)),
+        MAX_FETCH_ATTEMPTS,
+    )
+    posted = []
+    while waiting:
+        batch = list(itertools.islice(queue, EXTRACT_CANDIDATES))
+        if not batch:
+            break
+        # статья нужна хотя бы одному каналу, который ещё ждёт
+        batch = [it for it in batch if takers(it[0], it[4] if len(it) > 4 else None)]
+        if not batch:
+            continue
+        arts = pick_articles(batch, accept=lambda a: bool(takers(a["link"], a["feeds"], a["category"])),
+                             offline=offline)
+        # уже извлечённые статьи не выбрасываем: что не взяла лучшая, получает следующая
+        for art in arts:
+            targets = takers(art["link"], art["feeds"], art["category"])
+            if not targets:
+                continue
+            try:
+                ok = publish(art, targets)
+            except Exception as e:
+                # лог и продолжаем
+                metrics.error("publish", e, link=art["link"])
                 continue
+            posted.append(art["link"])
+            # одна свежая новость на канал за запуск; не дошедшие попробуют в следующий раз
+            waiting = [ch for ch in waiting if ch not in targets]
+            if len(ok) < len(targets):
+                print("Not delivered:", ", ".join(ch.id for ch in targets if ch.id not in ok))
+            if not waiting:
+                break
+    return posted
 
-            # Обложка
-            now_local = datetime.now(LOCAL_TZ)
-            img = draw_header_image(title, domain_of(link), category, now_local)
 
-            # Подпись
-            caption = build_caption(title, body, link, domain_of(link))
+# ----------- ДЕМОН -------------
 
-            tg_send_photo(img, caption)
-            mark_posted(link)
-            # публикуем только один свежий пост за запуск
-            break
+def run_daemon():
+    """
+    Тёплый процесс: ленты опрашиваются каждые POLL_INTERVAL секунд,
+    новость уходит в канал сразу, если с его прошлого поста прошло
+    POST_MIN_GAP (или min_gap канала);
+    присланное в SPOOL_DIR — в течение SPOOL_INTERVAL, без опроса лент;
+    дайджест — в DIGEST_HOURS. Состояние в памяти, на диск — раз в
+    SNAPSHOT_INTERVAL и при остановке (SIGTERM/SIGINT).
+    """
+    import digest
 
-        except Exception as e:
-            # лог и продолжаем
-            print("Error:", e)
-            continue
+    ensure_state()
+    sched = Scheduler()
+
+    def poll():
+        # каналам, у которых не вышел интервал, ленты даже не качаем
+        if not due_channels(POST_MIN_GAP):
+            return
+        with metrics.run("poster"):
+            if run_once(default_gap=POST_MIN_GAP):
+                flush_state()
+
+    def inbox():
+        # присланные новости — сразу, без опроса лент; интервал каналов по умолчанию не ждём
+        taken = spool.take()
+        if not taken:
+            return
+        with metrics.run("inbox"):
+            metrics.incr("inbox.items", len(taken))
+            posted = {canonical_url(link) for link in run_once([spool.candidate(rec) for _, rec in taken])}
+            if posted:
+                flush_state()
+            # снимаем вышедшие и решённые для всех каналов (дубль, короткая); остальные —
+            # каналам было рано или не скачалось — пробуем позже, пока не устарели
+            store, done, later = posted_store(), [], []
+            for path, rec in taken:
+                link = rec["link"]
+                if canonical_url(link) in posted or all(store.done_for(link, ch.id) for ch in channel_list()):
+                    done.append(path)
+                elif spool.age(path) > spool.SPOOL_MAX_AGE:
+                    print("Spool: giving up on", link)
+                    metrics.incr("inbox.expired")
+                    done.append(path)
+                else:
+                    later.append(path)
+            metrics.incr("inbox.deferred", len(later))
+        spool.done(done)
+        spool.defer(later)
+
+    def send_digest():
+        flush_state()
+        digest.main()
+
+    def stop(signum, frame):
+        print("Stopping on signal", signum)
+        sched.stop.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    warm_backgrounds()
+    sched.every(SPOOL_INTERVAL, inbox, name="inbox")
+    sched.every(POLL_INTERVAL, poll, name="poll")
+    sched.every(SNAPSHOT_INTERVAL, flush_state, name="snapshot", delay=SNAPSHOT_INTERVAL)
+    sched.at_hours(DIGEST_HOURS, send_digest, LOCAL_TZ, name="digest")
+    try:
+        sched.run()
+    finally:
+        flush_state()
 
 
 # ------------------------------
 
 if __name__ == "__main__":
-    # среда в CI может быть перегружена DNS — легкая задержка
-    time.sleep(1)
-    main()
+    ap = argparse.ArgumentParser(description="USDT=Dollar news poster")
+    ap.add_argument("--daemon", action="store_true", help="долгоживущий процесс со своим расписанием")
+    ap.add_argument("--single", action="store_true",
+                    help="одна новость из USDT_TITLE/USDT_LINK/USDT_SUM/USDT_SRC вместо опроса лент")
+    ap.add_argument("--enqueue", action="store_true", help="с --single: положить её в очередь демона")
+    args, _ = ap.parse_known_args()
+    if args.daemon:
+        run_daemon()
+    elif args.single:
+        main_single(args.enqueue)
+    else:
+        # среда в CI может быть перегружена DNS — легкая задержка
+        time.sleep(1)
+        main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Скользящий агрегат для дайджестов: постер дописывает каждую публикацию,
+дайджест читает готовые верхушки вместо разбора журнала.
+
+Публикации раскладываются по часовым корзинам; в каждой корзине — кучи
+top-K по оценке: общая ("all"), по рубрике ("cat:…") и по каналу ("chat:…";
+"legacy" — записи без chats, ушедшие во все каналы). Добавление — O(log K),
+дайджест за N часов — слияние N корзин по K записей, от длины журнала не
+зависит. Верхушка объединения корзин = верхушка объединения их верхушек,
+поэтому ответ точный, пока в запросе k <= ROLLUP_K.
+"""
+
+import heapq
+import json
+import os
+import time
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from sources import SOURCE_WEIGHTS
+from store import parse_ts, utcnow
+
+ROLLUP_FILE = os.path.join("data", "digest_rollup.json")
+# сколько лучших держим в каждой куче и сколько часов корзин
+ROLLUP_K = int(os.getenv("ROLLUP_K", "30"))
+ROLLUP_KEEP_HOURS = int(os.getenv("ROLLUP_KEEP_HOURS", "48"))
+BUCKET = 3600
+
+
+def score_of(link: str, chats=None) -> float:
+    """Оценка публикации: вес источника; ушедшая в несколько каналов — чуть выше."""
+    domain = urlparse(link).netloc.replace("www.", "")
+    return SOURCE_WEIGHTS.get(domain, 1.0) * (1 + 0.1 * (len(chats) - 1 if chats else 0))
+
+
+class Rollup:
+    def __init__(self, path: str = ROLLUP_FILE, k: int = ROLLUP_K, keep_hours: int = ROLLUP_KEEP_HOURS):
+        self.path = path
+        self.k = k
+        self.keep_hours = keep_hours
+        # час (ts // BUCKET) -> {ключ кучи: [[score, ts, link, title, category, event_utc], ...]}
+        self.buckets = {}
+        self.dirty = False
+        self.loaded = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("k") == k:
+                    self.buckets = {int(h): b for h, b in data.get("buckets", {}).items()}
+                    self.loaded = True
+            except Exception:
+                self.buckets = {}
+
+    def __len__(self):
+        return sum(len(b.get("all", ())) for b in self.buckets.values())
+
+    def add(self, link: str, title: str, ts: float = None, category: str = None,
+            event_utc: str = None, chats=None):
+        ts = ts or time.time()
+        entry = [score_of(link, chats), ts, link, title, category or "", event_utc]
+        keys = ["all"]
+        if category:
+            keys.append("cat:" + category)
+        keys += ["legacy"] if chats is None else ["chat:" + c for c in chats]
+        bucket = self.buckets.setdefault(int(ts // BUCKET), {})
+        for key in keys:
+            heap = bucket.setdefault(key, [])
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        self.dirty = True
+
+    def add_record(self, rec: dict):
+        """Запись журнала kind="posted"."""
+        self.add(rec["link"], rec.get("title") or "", parse_ts(rec["ts"]).timestamp(),
+                 rec.get("category"), rec.get("event_utc"), rec.get("chats"))
+
+    def top(self, start: float, end: float = None, k: int = None, category: str = None, chat: str = None) -> list:
+        """
+        Лучшие k публикаций с start по end (unix-время), по убыванию оценки:
+        [{"ts", "link", "title", "category", "event_utc", "score"}].
+        """
+        end = end or time.time()
+        k = min(k or self.k, self.k)
+        if chat:
+            keys = ("chat:" + chat, "legacy")
+        elif category:
+            keys = ("cat:" + category,)
+        else:
+            keys = ("all",)
+        best = {}
+        for hour in range(int(start // BUCKET), int(end // BUCKET) + 1):
+            bucket = self.buckets.get(hour)
+            if not bucket:
+                continue
+            for key in keys:
+                for e in bucket.get(key, ()):
+                    if not start <= e[1] <= end or (category and e[4] != category):
+                        continue
+                    if e[2] not in best or e > best[e[2]]:
+                        best[e[2]] = e
+        return [
+            {"ts": e[1], "link": e[2], "title": e[3], "category": e[4], "event_utc": e[5], "score": e[0]}
+            for e in heapq.nlargest(k, best.values())
+        ]
+
+    def evict(self, now: float = None):
+        cutoff = int((now or time.time()) // BUCKET) - self.keep_hours
+        for h in [h for h in self.buckets if h < cutoff]:
+            del self.buckets[h]
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.evict()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"k": self.k, "buckets": self.buckets}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def load(log, path: str = ROLLUP_FILE) -> Rollup:
+    """Агрегат с диска; нет файла (первый запуск, сменился K) — собираем из журнала."""
+    agg = Rollup(path)
+    if not agg.loaded:
+        for rec in log.read_since(utcnow() - timedelta(hours=agg.keep_hours), kinds={"posted"}):
+            agg.add_record(rec)
+    return agg
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Простой планировщик для долгоживущего процесса:
+периодические задачи и задачи «в заданные часы», остановка по событию.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Scheduler:
+    def __init__(self):
+        self.stop = threading.Event()
+        self._heap = []
+        self._seq = itertools.count()
+
+    def _push(self, at: float, name: str, fn, next_at):
+        heapq.heappush(self._heap, (at, next(self._seq), name, fn, next_at))
+
+    def every(self, seconds: float, fn, name: str = None, delay: float = 0):
+        """Каждые seconds секунд (первый раз — через delay)."""
+        self._push(time.time() + delay, name or fn.__name__, fn, lambda now: now + seconds)
+
+    def at_hours(self, hours, fn, tz, name: str = None, minute: int = 0):
+        """Каждый день в указанные часы по часовому поясу tz."""
+        def next_at(now):
+            local = datetime.fromtimestamp(now, tz)
+            for day in range(2):
+                base = (local + timedelta(days=day)).replace(minute=minute, second=0, microsecond=0)
+                for h in sorted(hours):
+                    cand = base.replace(hour=h)
+                    if cand.timestamp() > now:
+                        return cand.timestamp()
+            return now + 86400
+        self._push(next_at(time.time()), name or fn.__name__, fn, next_at)
+
+    def run(self):
+        while not self.stop.is_set() and self._heap:
+            at, _, name, fn, next_at = self._heap[0]
+            wait = at - time.time()
+            if wait > 0:
+                # ждём на событии — SIGTERM будит сразу
+                self.stop.wait(min(wait, 60))
+                continue
+            heapq.heappop(self._heap)
+            try:
+                fn()
+            except Exception as e:
+                print(f"Job {name} failed:", e)
+            self._push(next_at(time.time()), name, fn, next_at)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Источники: статистика извлечения по доменам и очередь кандидатов с приоритетом.
+"""
+
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+SOURCES_FILE = os.path.join("data", "sources.json")
+
+# вес источника (домен без www); остальные — 1.0
+SOURCE_WEIGHTS = {
+    "tass.ru": 1.2,
+    "ria.ru": 1.2,
+    "interfax.ru": 1.2,
+    "rbc.ru": 1.15,
+    "rssexport.rbc.ru": 1.15,
+    "kommersant.ru": 1.1,
+    "vedomosti.ru": 1.1,
+    "lenta.ru": 1.0,
+    "kp.ru": 0.8,
+}
+
+# полураспад свежести (часы) и оценка для записей без даты
+FRESH_HALF_LIFE_H = 3.0
+FRESH_UNKNOWN = 0.3
+# каждый следующий кандидат с того же домена умножается на этот коэффициент
+SOURCE_FAIRNESS = 0.6
+
+# сколько последних замеров (задержка, длина текста) держим на домен
+SAMPLES = 25
+# предохранитель: после BREAKER_FAILS неудач подряд домен отдыхает
+# BREAKER_BASE секунд, каждая следующая неудача удваивает паузу до BREAKER_MAX
+BREAKER_FAILS = int(os.getenv("BREAKER_FAILS", "3"))
+BREAKER_BASE = float(os.getenv("BREAKER_BASE", "1800"))
+BREAKER_MAX = float(os.getenv("BREAKER_MAX", str(24 * 3600)))
+
+
+class SourceStats:
+    """
+    Профиль домена в data/sources.json: попытки и успехи, последние задержки
+    и длины текста, счётчик неудач подряд и предохранитель.
+    """
+
+    def __init__(self, path: str = SOURCES_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.domains = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.domains = json.load(f)
+            except Exception:
+                self.domains = {}
+        self.dirty = False
+
+    def get(self, domain: str) -> dict:
+        return self.domains.get(domain) or {"attempts": 0, "ok": 0}
+
+    def record(self, domain: str, ok: bool, latency: float = None, body_len: int = None):
+        now = time.time()
+        with self.lock:
+            d = self.domains.setdefault(domain, {"attempts": 0, "ok": 0})
+            d["attempts"] += 1
+            d["ok"] += 1 if ok else 0
+            if latency is not None:
+                d["latency"] = (d.get("latency", []) + [round(latency, 2)])[-SAMPLES:]
+            if body_len is not None:
+                d["body_len"] = (d.get("body_len", []) + [body_len])[-SAMPLES:]
+            if ok:
+                d["fails"] = 0
+                d.pop("open_until", None)
+            else:
+                d["fails"] = d.get("fails", 0) + 1
+                over = d["fails"] - BREAKER_FAILS
+                if over >= 0:
+                    d["open_until"] = now + min(BREAKER_MAX, BREAKER_BASE * 2 ** over)
+            self.dirty = True
+
+    def available(self, domain: str, now: float = None) -> bool:
+        """False, пока предохранитель домена открыт. После паузы — одна пробная попытка."""
+        return self.get(domain).get("open_until", 0) <= (now or time.time())
+
+    def success_rate(self, domain: str) -> float:
+        # сглаживание Лапласа: новый домен — 0.5
+        d = self.get(domain)
+        return (d["ok"] + 1) / (d["attempts"] + 2)
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.domains, ensure_ascii=False, indent=1, sort_keys=True)
+            self.dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+def freshness(published, now=None) -> float:
+    if not published:
+        return FRESH_UNKNOWN
+    now = now or datetime.now(timezone.utc)
+    age_h = max(0.0, (now - published).total_seconds() / 3600)
+    return math.exp(-age_h * math.log(2) / FRESH_HALF_LIFE_H)
+
+
+def base_score(published, domain: str, stats: SourceStats, now=None) -> float:
+    return freshness(published, now) * SOURCE_WEIGHTS.get(domain, 1.0) * stats.success_rate(domain)
+
+
+def iter_candidates(items, domain_of, stats: SourceStats, offline: set = None, trial: set = None):
+    """
+    Отдаёт кандидатов (link, title, published, fulltext) по убыванию приоритета.
+    Куча держит по одному «голове» каждого домена; взяли кандидата —
+    следующий с того же домена возвращается в кучу со штрафом SOURCE_FAIRNESS,
+    поэтому один источник не забивает всю выдачу; потолок попыток за запуск — у вызывающего.
+    В offline добавляются ссылки, страницу которых качать нельзя (предохранитель
+    домена открыт или пробная попытка уже отдана): их берут только по тексту из ленты.
+    trial — домены, чья пробная загрузка уже отдана (общий на несколько очередей запуска).
+    """
+    now = datetime.now(timezone.utc)
+    ts = time.time()
+    per_domain = {}
+    trial = set() if trial is None else trial
+    for it in items:
+        d = domain_of(it[0])
+        has_text = len(it) > 3 and bool(it[3])
+        # полуоткрытый предохранитель: после паузы — только одна пробная загрузка
+        half_open = stats.get(d).get("fails", 0) >= BREAKER_FAILS
+        if not stats.available(d, ts) or (half_open and d in trial):
+            # страницу не качаем; с текстом в ленте — только по нему
+            if not has_text:
+                continue
+            if offline is not None:
+                offline.add(it[0])
+        elif half_open:
+            trial.add(d)
+        per_domain.setdefault(d, []).append((base_score(it[2], d, stats, now), it))
+
+    heap = []
+    for d, lst in per_domain.items():
+        lst.sort(key=lambda x: x[0], reverse=True)
+        heapq.heappush(heap, (-lst[0][0], d, 0))
+
+    while heap:
+        _, d, i = heapq.heappop(heap)
+        yield per_domain[d][i][1]
+        if i + 1 < len(per_domain[d]):
+            score = per_domain[d][i + 1][0] * SOURCE_FAIRNESS ** (i + 1)
+            heapq.heappush(heap, (-score, d, i + 1))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Входящие новости «снаружи» (dispatch, свои скрипты) — каталог-очередь.
+
+Каждая новость — отдельный JSON-файл в SPOOL_DIR:
+    {"link": ..., "title": ..., "summary": ..., "source": ..., "published": iso|None}
+Файл пишется атомарно (tmp + rename), так что демон не увидит его наполовину.
+Демон забирает файлы переименованием в *.work и удаляет после публикации;
+если процесс упал посередине, *.work подхватываются при следующем take().
+Не вышедшая новость (каналам рано, сбой сети) остаётся *.work и откладывается
+через mtime в будущем: take() её не видит до этого времени.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from store import parse_ts, utcnow, canonical_url
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", os.path.join("data", "inbox"))
+# сколько файлов за раз (остальные — в следующий заход)
+SPOOL_BATCH = int(os.getenv("SPOOL_BATCH", "20"))
+# повтор не вышедшей новости: не раньше SPOOL_RETRY секунд и не раньше половины её
+# возраста (60 с, 90 с, 135 с …); старше SPOOL_MAX_AGE — снимается
+SPOOL_RETRY = float(os.getenv("SPOOL_RETRY", "60"))
+SPOOL_MAX_AGE = float(os.getenv("SPOOL_MAX_AGE", str(6 * 3600)))
+
+# переменные dispatch.yml: client_payload.title/link/summary/source
+ENV_FIELDS = {"title": "USDT_TITLE", "link": "USDT_LINK", "summary": "USDT_SUM", "source": "USDT_SRC"}
+
+
+def item_from_env(env=os.environ):
+    """Новость из USDT_* или None, если ссылки нет."""
+    rec = {k: (env.get(v) or "").strip() for k, v in ENV_FIELDS.items()}
+    return rec if rec["link"] else None
+
+
+def push(rec: dict, spool_dir: str = SPOOL_DIR) -> str:
+    """Положить новость в очередь; возвращает путь файла."""
+    if not rec.get("link"):
+        raise ValueError("spool item without link")
+    os.makedirs(spool_dir, exist_ok=True)
+    # имя = время + хеш ссылки: порядок поступления и без коллизий
+    h = hashlib.sha1(canonical_url(rec["link"]).encode("utf-8")).hexdigest()[:10]
+    path = os.path.join(spool_dir, f"{time.time_ns()}-{h}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(rec, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def take(spool_dir: str = SPOOL_DIR, limit: int = SPOOL_BATCH) -> list:
+    """
+    Забрать до limit новостей в порядке поступления: [(путь *.work, запись)].
+    Повторы одной ссылки внутри пачки схлопываются; битые файлы — в *.bad.
+    """
+    if not os.path.isdir(spool_dir):
+        return []
+    now = time.time()
+    names = sorted(n for n in os.listdir(spool_dir)
+                   if n.endswith(".json") or (n.endswith(".json.work") and not _deferred(os.path.join(spool_dir, n), now)))
+    out, links = [], set()
+    for name in names[:limit]:
+        path = os.path.join(spool_dir, name)
+        work = path if name.endswith(".work") else path + ".work"
+        try:
+            if work != path:
+                os.replace(path, work)
+            with open(work, "r", encoding="utf-8") as f:
+                rec = json.load(f)
+            key = canonical_url(rec["link"])
+        except FileNotFoundError:
+            continue
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print("Spool: bad item", name, e)
+            os.replace(work, work[:-len(".work")] + ".bad")
+            continue
+        if key in links:
+            os.remove(work)
+            continue
+        links.add(key)
+        out.append((work, rec))
+    return out
+
+
+def _deferred(path: str, now: float) -> bool:
+    try:
+        return os.path.getmtime(path) > now
+    except FileNotFoundError:
+        return True
+
+
+def age(path: str, now: float = None) -> float:
+    """Сколько секунд новость в очереди (время — в начале имени файла)."""
+    try:
+        ns = int(os.path.basename(path).split("-", 1)[0])
+    except ValueError:
+        return 0.0
+    return max(0.0, (now or time.time()) - ns / 1e9)
+
+
+def done(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+
+def defer(paths):
+    """Оставить *.work до следующей попытки (см. SPOOL_RETRY)."""
+    now = time.time()
+    for p in paths:
+        t = now + max(SPOOL_RETRY, age(p, now) / 2)
+        try:
+            os.utime(p, (t, t))
+        except FileNotFoundError:
+            pass
+
+
+def candidate(rec: dict) -> tuple:
+    """
+    Запись очереди -> кандидат как из fetch_items: (link, title, published, fulltext, feeds).
+    summary идёт как текст из ленты (если его мало — статья качается);
+    лента None — новость подходит каналам с любым списком лент.
+    """
+    published = None
+    if rec.get("published"):
+        try:
+            published = parse_ts(rec["published"])
+        except (TypeError, ValueError):
+            published = None
+    return (rec["link"], rec.get("title") or "", published or utcnow(), rec.get("summary") or None, None)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Общее состояние постера и дайджеста.
+
+EventLog — журнал событий в data/events.jsonl: одна JSON-запись на строку,
+дописывается в конец за O(1), читается окнами с хвоста, периодически
+уплотняется. PostedStore — индекс опубликованных ссылок поверх журнала:
+загружается один раз за запуск в словарь {каноническая ссылка: время},
+новые записи сбрасываются на диск пачкой.
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+DATA_DIR = "data"
+EVENTS_FILE = os.path.join(DATA_DIR, "events.jsonl")
+
+# сколько дней помним опубликованные ссылки
+POSTED_TTL_DAYS = float(os.getenv("POSTED_TTL_DAYS", "30"))
+# после какого размера журнал уплотняется
+COMPACT_BYTES = int(os.getenv("EVENTS_COMPACT_BYTES", str(2 * 1024 * 1024)))
+
+# трекинговые параметры, которые не меняют саму статью
+_TRACKING_PREFIXES = ("utm_",)
+_TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "_openstat", "ref", "rss", "from_rss"}
+
+# события, по которым ссылка считается уже обработанной
+DEDUP_KINDS = {"posted", "seen"}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Ключ для сравнения ссылок: без схемы, www, фрагмента,
+    завершающего слеша и utm-меток; параметры отсортированы.
+    """
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+    except Exception:
+        return url
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PREFIXES) and k.lower() not in _TRACKING_PARAMS
+    ]
+    q = urlencode(sorted(query))
+    return f"{host}{path}?{q}" if q else f"{host}{path}"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def parse_ts(s: str) -> datetime:
+    dt = datetime.fromisoformat(s)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+# ----------- ЖУРНАЛ -------------
+
+class EventLog:
+    def __init__(self, path: str = EVENTS_FILE):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            import_legacy(self, os.path.dirname(path) or ".")
+
+    def append(self, kind: str, ts: datetime = None, **fields) -> dict:
+        rec = {"kind": kind, "ts": (ts or utcnow()).isoformat(), **fields}
+        self.append_many([rec])
+        return rec
+
+    def append_many(self, records):
+        if not records:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _iter_reversed(self, block=65536):
+        # читаем файл блоками с конца, отдаём записи от новых к старым
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            tail = b""
+            while pos > 0:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step) + tail
+                lines = chunk.split(b"\n")
+                tail = lines.pop(0)
+                for ln in reversed(lines):
+                    rec = _decode(ln)
+                    if rec is not None:
+                        yield rec
+            rec = _decode(tail)
+            if rec is not None:
+                yield rec
+
+    def read_since(self, since: datetime, kinds=None) -> list:
+        """
+        Записи новее since (по возрастанию времени). Файл читается с хвоста
+        и только до начала окна — весь журнал не разбирается.
+        """
+        out = []
+        for rec in self._iter_reversed():
+            try:
+                if parse_ts(rec["ts"]) < since:
+                    break
+            except Exception:
+                continue
+            if kinds is None or rec.get("kind") in kinds:
+                out.append(rec)
+        out.reverse()
+        return out
+
+    def last(self, kind: str):
+        for rec in self._iter_reversed():
+            if rec.get("kind") == kind:
+                return rec
+        return None
+
+    def compact(self, keep_days: float = POSTED_TTL_DAYS):
+        """
+        Переписывает журнал: остаются записи за keep_days
+        и последняя запись каждого вида (например, отметка дайджеста).
+        """
+        since = utcnow() - timedelta(days=keep_days)
+        fresh = self.read_since(since)
+        latest = {}
+        for rec in self._iter_reversed():
+            latest.setdefault(rec.get("kind"), rec)
+        extra = [r for r in latest.values() if parse_ts(r["ts"]) < since]
+        records = sorted(extra, key=lambda r: r["ts"]) + fresh
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def maybe_compact(self, keep_days: float = POSTED_TTL_DAYS):
+        try:
+            if os.path.getsize(self.path) > COMPACT_BYTES:
+                self.compact(keep_days)
+        except OSError:
+            pass
+
+
+def _decode(line: bytes):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line.decode("utf-8"))
+    except Exception:
+        return None
+
+
+def import_legacy(log: EventLog, data_dir: str):
+    """
+    Однократный перенос старых файлов (history.json, posted.json, state.json)
+    в журнал. Сами файлы не трогаем.
+    """
+    def load(name, default):
+        p = os.path.join(data_dir, name)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return default
+
+    records = []
+    hist = load("history.json", [])
+    for it in hist if isinstance(hist, list) else []:
+        try:
+            records.append({
+                "kind": "posted",
+                "ts": parse_ts(it["posted_utc"]).isoformat(),
+                "link": it["link"],
+                "title": it.get("title", ""),
+                "event_utc": it.get("event_utc"),
+                "tags": it.get("tags"),
+            })
+        except Exception:
+            continue
+
+    known = {canonical_url(r["link"]) for r in records}
+    links = []
+    posted = load("posted.json", {}).get("links", [])
+    links += list(posted.items()) if isinstance(posted, dict) else [(u, None) for u in posted]
+    links += [(u, None) for u in load("state.json", {}).get("posted_links", [])]
+
+    # у старых ссылок нет времени — ставим самое раннее известное,
+    # чтобы журнал оставался упорядоченным по времени
+    records.sort(key=lambda r: r["ts"])
+    floor = records[0]["ts"] if records else utcnow().isoformat()
+    seen = []
+    for u, _ts in links:
+        key = canonical_url(u)
+        if key in known:
+            continue
+        known.add(key)
+        seen.append({"kind": "seen", "ts": floor, "link": u})
+
+    digest = load("digest_state.json", {}).get("last_digest_utc")
+    tail = [{"kind": "digest", "ts": parse_ts(digest).isoformat()}] if digest else []
+    # файл создаётся даже пустым — миграция больше не повторится
+    with open(log.path, "a", encoding="utf-8"):
+        pass
+    log.append_many(seen + records + tail)
+
+
+# ----------- ДУБЛИКАТЫ -------------
+
+class PostedStore:
+    """
+    Что уже было: ссылки «posted» и «seen» за ttl_days.
+    У записи публикации есть список чатов (chats), куда она ушла: одна запись
+    на статью, сколько бы каналов её ни взяли. Записи без chats — из времён
+    одного канала и считаются разосланными везде. «seen» с chats — отказ только
+    для этих чатов (почти-дубль того, что ушло именно туда), без chats — для всех.
+    """
+
+    def __init__(self, log: EventLog, ttl_days: float = POSTED_TTL_DAYS):
+        self.log = log
+        self.ttl = ttl_days * 86400
+        self.links: dict[str, float] = {}
+        # ссылка -> чаты публикации; None — во все
+        self.chats: dict[str, set] = {}
+        # ссылка -> чаты, для которых она отбракована; None — для всех
+        self.skipped: dict[str, set] = {}
+        # чат -> время последнего поста; last_any — для записей без chats
+        self.last_post: dict[str, float] = {}
+        self.last_any = 0.0
+        self.pending = []
+        since = utcnow() - timedelta(seconds=self.ttl)
+        for rec in log.read_since(since, kinds=DEDUP_KINDS):
+            self._remember(rec.get("kind"), canonical_url(rec.get("link", "")),
+                           parse_ts(rec["ts"]).timestamp(), rec.get("chats"))
+
+    def _remember(self, kind, key, ts, chats):
+        self.links[key] = ts
+        target = self.chats if kind == "posted" else self.skipped
+        if chats is None:
+            target[key] = None
+            if kind == "posted":
+                self.last_any = max(self.last_any, ts)
+            return
+        if key not in target or target[key] is not None:
+            target.setdefault(key, set()).update(chats)
+        if kind != "posted":
+            return
+        for c in chats:
+            self.last_post[c] = max(self.last_post.get(c, 0.0), ts)
+
+    def __contains__(self, link: str) -> bool:
+        return canonical_url(link) in self.links
+
+    def done_for(self, link: str, chat: str) -> bool:
+        """Уже ушла в этот чат или отбракована для него (или для всех)."""
+        key = canonical_url(link)
+        for known in (self.chats, self.skipped):
+            if key in known and (known[key] is None or chat in known[key]):
+                return True
+        return False
+
+    def due(self, chat: str, gap: float, now: float = None) -> bool:
+        """Прошло ли gap секунд с последнего поста в чат."""
+        if not gap or gap <= 0:
+            return True
+        last = max(self.last_post.get(chat, 0.0), self.last_any)
+        return (now or time.time()) - last >= gap
+
+    def add(self, link: str, kind: str = "seen", **fields):
+        key = canonical_url(link)
+        if kind == "seen" and self.skipped.get(key, ()) is None:
+            return
+        self._remember(kind, key, time.time(), fields.get("chats"))
+        self.pending.append({"kind": kind, "ts": utcnow().isoformat(), "link": link, **fields})
+
+    def evict(self, now: float = None):
+        cutoff = (now or time.time()) - self.ttl
+        for k in [k for k, ts in self.links.items() if ts < cutoff]:
+            del self.links[k]
+            self.chats.pop(k, None)
+            self.skipped.pop(k, None)
+
+    def flush(self):
+        # демон держит хранилище неделями: то, что старше ttl, в журнале уже
+        # не читается и сжатием удаляется — из памяти тоже
+        self.evict()
+        if not self.pending:
+            return
+        self.log.append_many(self.pending)
+        self.pending = []
+        self.log.maybe_compact(self.ttl / 86400)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Очистка текста статьи: один split/join и один lower на абзац вместо
+цепочек .lower()/.split()/.replace(). Служебные фразы — по таблицам
+(поиск подстроки в CPython быстрее альтернации в re), «облако тегов» —
+предфильтр выражением и точный подсчёт только для подозрительных абзацев.
+Абзацы остаются абзацами: между ними "\\n\\n".
+"""
+
+import re
+
+# служебные абзацы: любая из фраз; обе фразы пары; начало абзаца
+JUNK_ANY = ("подписывайтесь",)
+JUNK_ALL = (("телеграм", "канал"),)
+JUNK_PREFIX = ("читайте также", "см. также", "по теме")
+
+# «облако тегов»: больше TAG_CLOUD_TITLES слов с заглавной при длине больше TAG_CLOUD_WORDS
+TAG_CLOUD_TITLES = 12
+TAG_CLOUD_WORDS = 30
+# начало слова с заглавной (после пробела, можно за кавычкой/скобкой) — верхняя оценка
+_CAP_START = re.compile(r" [«\"'(]?[A-ZА-ЯЁ]")
+
+# разрыв абзаца в готовом тексте: пустая строка
+_PARA_BREAK = re.compile(r"\s*\n\s*\n\s*")
+
+
+def squash(text: str) -> str:
+    """Пробелы схлопнуты (и \\xa0, и переводы строк), пробел перед , и . убран."""
+    return " ".join(text.split()).replace(" ,", ",").replace(" .", ".")
+
+
+def is_tag_cloud(par: str, words: int) -> bool:
+    if words <= TAG_CLOUD_WORDS:
+        return False
+    if len(_CAP_START.findall(par)) + 1 <= TAG_CLOUD_TITLES:
+        return False
+    return sum(map(str.istitle, par.split())) > TAG_CLOUD_TITLES
+
+
+def is_junk(par: str) -> bool:
+    low = par.lower()
+    if low.startswith(JUNK_PREFIX):
+        return True
+    if any(w in low for w in JUNK_ANY):
+        return True
+    return any(all(w in low for w in group) for group in JUNK_ALL)
+
+
+def clean_paragraphs(texts) -> list:
+    """Сырые тексты абзацев -> чистые, без мусора и повторов, в исходном порядке."""
+    out = []
+    seen = set()
+    for t in texts:
+        tokens = t.split()
+        if not tokens:
+            continue
+        t = " ".join(tokens)
+        if t in seen or is_junk(t) or is_tag_cloud(t, len(tokens)):
+            continue
+        seen.add(t)
+        out.append(t.replace(" ,", ",").replace(" .", "."))
+    return out
+
+
+def normalize(text: str) -> str:
+    """Готовый текст: абзацы по пустым строкам, внутри каждого — squash()."""
+    return "\n\n".join(p for p in map(squash, _PARA_BREAK.split(text)) if p)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Клиент Telegram Bot API для постера и дайджеста.
+
+Один пул соединений, ограничение частоты (на чат и общее), уважение
+429 retry_after, повторы с джиттером, параллельная отправка в несколько чатов.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from net import session
+
+# лимиты Bot API: ~30 сообщений/с на бота, ~20/мин в одну группу/канал
+GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+CHAT_INTERVAL = float(os.getenv("TG_CHAT_INTERVAL", "3"))
+MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "4"))
+TIMEOUT = float(os.getenv("TG_TIMEOUT", "20"))
+# адрес Bot API (для локального сервера или заглушки в бенчмарках)
+API_URL = os.getenv("TG_API_URL", "https://api.telegram.org")
+# file_id загруженных файлов: повторная отправка тех же байтов — без загрузки
+FILE_IDS_FILE = os.path.join("data", "tg_files.json")
+FILE_IDS_MAX = int(os.getenv("TG_FILE_IDS_MAX", "500"))
+
+
+def parse_chat_ids(raw: str) -> list:
+    """CHANNEL_ID может содержать несколько каналов через запятую."""
+    return [c.strip() for c in (raw or "").split(",") if c.strip()]
+
+
+class TelegramError(RuntimeError):
+    def __init__(self, method, status, text):
+        super().__init__(f"Telegram {method} error {status}: {text}")
+        self.status = status
+
+
+class TelegramClient:
+    def __init__(self, token: str, workers: int = 4):
+        self.token = token
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tg")
+        self._guard = threading.Lock()
+        self._global_next = 0.0
+        self._chat_next: dict[str, float] = {}
+        self._chat_locks: dict[str, threading.Lock] = {}
+
+    # ----------- лимиты -------------
+
+    def _chat_lock(self, chat_id) -> threading.Lock:
+        with self._guard:
+            return self._chat_locks.setdefault(str(chat_id), threading.Lock())
+
+    def _wait_turn(self, chat_id):
+        # вызывается под блокировкой чата: сообщения в один чат идут по очереди
+        key = str(chat_id)
+        while True:
+            with self._guard:
+                now = time.monotonic()
+                at = max(self._chat_next.get(key, 0.0), self._global_next)
+                if at <= now:
+                    self._global_next = now + 1.0 / GLOBAL_RATE
+                    self._chat_next[key] = now + CHAT_INTERVAL
+                    return
+            time.sleep(at - now)
+
+    def _backoff(self, chat_id, seconds: float):
+        with self._guard:
+            key = str(chat_id)
+            self._chat_next[key] = max(self._chat_next.get(key, 0.0), time.monotonic() + seconds)
+
+    # ----------- вызовы -------------
+
+    def call(self, method: str, chat_id, data: dict, files: dict = None) -> dict:
+        """
+        Блокирующий вызов метода для чата с учётом лимитов и повторов.
+        files: {"photo": (name, bytes, mime)} — байты, чтобы повтор мог отправить их снова.
+        """
+        url = f"{API_URL}/bot{self.token}/{method}"
+        payload = dict(data, chat_id=chat_id)
+        with self._chat_lock(chat_id):
+            for attempt in range(MAX_RETRIES + 1):
+                self._wait_turn(chat_id)
+                try:
+                    r = session().post(url, data=payload, files=files, timeout=TIMEOUT)
+                except requests.RequestException as e:
+                    if attempt == MAX_RETRIES:
+                        raise
+                    print(f"Telegram {method}: {e}, retry")
+                    time.sleep(self._jitter(attempt))
+                    continue
+
+                if r.ok:
+                    return r.json().get("result") or {}
+                if r.status_code == 429:
+                    try:
+                        wait_s = float(r.json()["parameters"]["retry_after"])
+                    except Exception:
+                        wait_s = self._jitter(attempt)
+                    print(f"Telegram {method}: 429, retry after {wait_s:.0f}s")
+                    self._backoff(chat_id, wait_s + random.uniform(0, 1))
+                    if attempt < MAX_RETRIES:
+                        continue
+                elif r.status_code >= 500 and attempt < MAX_RETRIES:
+                    time.sleep(self._jitter(attempt))
+                    continue
+                raise TelegramError(method, r.status_code, r.text)
+
+    @staticmethod
+    def _jitter(attempt: int) -> float:
+        return min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    # ----------- методы -------------
+
+    def send_photo(self, chat_id, photo, caption_html: str, name: str = "cover.jpg",
+                   mime: str = "image/jpeg") -> dict:
+        """photo: байты (загрузка) или file_id уже загруженного файла (строка)."""
+        data = {"caption": caption_html, "parse_mode": "HTML", "disable_web_page_preview": True}
+        if isinstance(photo, str):
+            return self.call("sendPhoto", chat_id, dict(data, photo=photo))
+        return self.call("sendPhoto", chat_id, data, {"photo": (name, photo, mime)})
+
+    def send_message(self, chat_id, text: str, parse_mode: str = "HTML") -> dict:
+        data = {"text": text, "parse_mode": parse_mode}
+        return self.call("sendMessage", chat_id, data)
+
+
+_clients: dict[str, TelegramClient] = {}
+_clients_lock = threading.Lock()
+
+
+def client(token: str) -> TelegramClient:
+    """Один клиент (и одна очередь лимитов) на токен в процессе."""
+    with _clients_lock:
+        if token not in _clients:
+            _clients[token] = TelegramClient(token)
+        return _clients[token]
+
+
+# ----------- загруженные файлы -------------
+
+def photo_file_id(result: dict):
+    """file_id самого большого размера из ответа sendPhoto."""
+    sizes = (result or {}).get("photo") or []
+    return sizes[-1].get("file_id") if sizes else None
+
+
+class FileIds:
+    """
+    Хеш байтов -> file_id (data/tg_files.json), не больше FILE_IDS_MAX,
+    старые вытесняются. file_id привязан к боту: не подошёл — forget() и загрузка.
+    """
+
+    def __init__(self, path: str = FILE_IDS_FILE, limit: int = FILE_IDS_MAX):
+        self.path = path
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.ids = OrderedDict()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.ids.update(json.load(f))
+            except Exception:
+                self.ids.clear()
+        self.dirty = False
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        return hashlib.sha1(data).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            return self.ids.get(key)
+
+    def put(self, key: str, file_id: str):
+        with self.lock:
+            self.ids[key] = file_id
+            self.ids.move_to_end(key)
+            while len(self.ids) > self.limit:
+                self.ids.popitem(last=False)
+            self.dirty = True
+
+    def forget(self, key: str):
+        with self.lock:
+            if self.ids.pop(key, None) is not None:
+                self.dirty = True
+
+    def save(self):
+        if not self.dirty or not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.ids)
+            self.dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)